@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+from atomic import atomic_write_json
+from tracing import logger
+
+
+# Persisted Schwab account registry: account number -> hash value, account type,
+# tradability flags and user tags. Hashes almost never change, so runs read
+# them from disk instead of calling account_linked every time; the registry is
+# refreshed from the broker once it is older than its TTL, when its format
+# version changes, or on request (`python account_registry.py refresh`).
+#
+# Tags are local: they are kept across refreshes and let a run target a subset
+# of accounts (charles.py --tag). Closing-only accounts are known not to accept
+# opening buys, so those orders are dropped without asking the broker.
+#
+#   {"version": 1, "refreshed_at": 1700000000.0, "accounts": {
+#       "12345678": {"hash": "...", "type": "CASH", "closing_only": false,
+#                    "day_trader": false, "tags": ["ira"]}}}
+
+
+REGISTRY_VERSION = 1
+DEFAULT_REGISTRY_PATH = "./schwab_accounts.json"
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class AccountRegistry():
+    def __init__(self, path=DEFAULT_REGISTRY_PATH, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.refreshed_at = 0
+        self.accounts = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError:
+            logger.warning("Ignoring unreadable account registry {}", self.path)
+            return
+        if data.get("version") != REGISTRY_VERSION:
+            # Keep the tags, everything else is fetched again.
+            self.accounts = {number: {"tags": account.get("tags", [])} for number, account in data.get("accounts", {}).items()}
+            return
+        self.refreshed_at = data.get("refreshed_at", 0)
+        self.accounts = data.get("accounts", {})
+
+    # Written atomically, so a crash mid-save leaves the previous registry in place.
+    def save(self):
+        data = {"version": REGISTRY_VERSION, "refreshed_at": self.refreshed_at, "accounts": self.accounts}
+        atomic_write_json(self.path, data, indent=1)
+
+    def fresh(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            known = all("hash" in account for account in self.accounts.values())
+            return bool(self.accounts) and known and now - self.refreshed_at < self.ttl
+
+    # linked is the account_linked body, details the account_details_all body.
+    # Accounts no longer linked are dropped; tags of the others are kept.
+    def update(self, linked, details, now=None):
+        flags = {}
+        for entry in details:
+            account = entry["securitiesAccount"]
+            flags[str(account["accountNumber"])] = {
+                "type": account.get("type"),
+                "closing_only": bool(account.get("isClosingOnlyRestricted", False)),
+                "day_trader": bool(account.get("isDayTrader", False)),
+            }
+        with self.lock:
+            accounts = {}
+            for link in linked:
+                number = str(link["accountNumber"])
+                account = {"hash": link["hashValue"], "type": None, "closing_only": False, "day_trader": False}
+                account.update(flags.get(number, {}))
+                account["tags"] = self.accounts.get(number, {}).get("tags", [])
+                accounts[number] = account
+            self.accounts = accounts
+            self.refreshed_at = time.time() if now is None else now
+            self.save()
+
+    def hashes(self):
+        with self.lock:
+            return {number: account["hash"] for number, account in self.accounts.items()}
+
+    # Account numbers with any of the tags, or every account without tags.
+    def select(self, tags=None):
+        with self.lock:
+            if not tags:
+                return list(self.accounts)
+            return [number for number, account in self.accounts.items() if set(tags) & set(account.get("tags", ()))]
+
+    # Closing-only accounts can still sell but cannot open new positions.
+    def can_trade(self, number, side):
+        with self.lock:
+            account = self.accounts.get(number)
+        return account is None or side != "buy" or not account.get("closing_only", False)
+
+    def tag(self, tag, numbers):
+        self.retag(numbers, lambda tags: tags | {tag})
+
+    def untag(self, tag, numbers):
+        self.retag(numbers, lambda tags: tags - {tag})
+
+    def retag(self, numbers, change):
+        with self.lock:
+            for number in numbers:
+                if number not in self.accounts:
+                    raise ValueError(f"Unknown account {number}, refresh the registry first")
+                account = self.accounts[number]
+                account["tags"] = sorted(change(set(account.get("tags", ()))))
+            self.save()
+
+
+# Drop orders for accounts outside the selected tags and buys in accounts that
+# cannot trade, printing what was dropped. Returns the orders to keep.
+def filter_plan(registry, plan, tags=None):
+    selected = set(registry.select(tags)) if tags else None
+    kept = []
+    for order in plan:
+        if selected is not None and order.account_id not in selected:
+            continue
+        if not registry.can_trade(order.account_id, order.side):
+            print(f"account={order.account_id} {order.side} {order.symbol} skipped: account is closing-only")
+            continue
+        kept.append(order)
+    return kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show, refresh and tag the cached Schwab account registry")
+    parser.add_argument('--registry', type=str, default=DEFAULT_REGISTRY_PATH, help='Registry file')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='Print every registered account')
+    commands.add_parser('refresh', help='Fetch the linked accounts from Schwab now')
+    for name in ('tag', 'untag'):
+        command = commands.add_parser(name, help=f'{name.capitalize()} accounts')
+        command.add_argument('tag', type=str)
+        command.add_argument('accounts', type=str, nargs='+', help='Account numbers')
+    args = parser.parse_args()
+
+    registry = AccountRegistry(args.registry)
+    if args.command == 'refresh':
+        from dotenv import load_dotenv
+        import charles
+        load_dotenv()
+        client = charles.get_client(os.getenv('CHARLES_ACCESS_KEY'), os.getenv('CHARLES_SECRET_KEY'))
+        charles.refresh_registry(client, registry)
+    elif args.command in ('tag', 'untag'):
+        try:
+            getattr(registry, args.command)(args.tag, args.accounts)
+        except ValueError as e:
+            parser.error(str(e))
+
+    age = time.time() - registry.refreshed_at
+    print(f"{len(registry.accounts)} accounts, refreshed {age / 3600:.1f}h ago" if registry.refreshed_at else f"{len(registry.accounts)} accounts, never refreshed")
+    for number, account in registry.accounts.items():
+        flags = " closing-only" if account.get("closing_only") else ""
+        print(f"{number} {account.get('type') or '?'}{flags} tags={','.join(account.get('tags', [])) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
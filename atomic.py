@@ -0,0 +1,21 @@
+import json
+import os
+import tempfile
+
+
+# Write data as JSON to a temp file in the same directory then rename it over
+# path, so a crash or a concurrent run never leaves a half written file behind.
+# mode is applied before the rename, so the file is never readable with looser
+# permissions.
+def atomic_write_json(path, data, mode=None, indent=None):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=indent)
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,233 @@
+from collections import namedtuple
+import argparse
+import sys
+
+
+SIDES = ("buy", "sell")
+
+# One order to place: which account, which symbol and which side.
+PlannedOrder = namedtuple('PlannedOrder', ['account_id', 'symbol', 'side'])
+
+
+class OrderResult():
+    def __init__(self, account_id, symbol, side, status_code=None, latency=0.0, skipped=False, order_id=None):
+        self.account_id = account_id
+        self.symbol = symbol
+        self.side = side
+        self.status_code = status_code
+        self.latency = latency
+        self.skipped = skipped
+        # The broker's id for the placed order, when it returned one.
+        self.order_id = order_id
+
+    def failed(self):
+        return self.status_code is not None and self.status_code >= 300
+
+    def as_dict(self):
+        return {
+            "account_id": self.account_id,
+            "symbol": self.symbol,
+            "side": self.side,
+            "status_code": self.status_code,
+            "latency": self.latency,
+            "skipped": self.skipped,
+            "order_id": self.order_id,
+        }
+
+
+# Shared symbol arguments for the broker CLIs. Symbols can be given as
+# positional args (SYMBOL or SYMBOL:side) and/or read from a file or stdin, one
+# "SYMBOL [side]" per line. --buy/--sell set the side for symbols without one.
+def add_batch_arguments(parser):
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--buy', action='store_true', help='Buy a stock')
+    group.add_argument('--sell', action='store_true', help='Sell a stock')
+
+    parser.add_argument(
+        'symbols',
+        type=str,
+        nargs='*',
+        help='The stock symbols to buy or sell, optionally as SYMBOL:buy or SYMBOL:sell',
+    )
+    parser.add_argument(
+        '--file',
+        type=str,
+        help="Read 'SYMBOL [buy|sell]' lines from this file, or - for stdin",
+    )
+    parser.add_argument(
+        '--limit',
+        type=limit_argument,
+        help="Place limit orders at this price, or 'auto' to price off the last quote. Market orders if absent",
+    )
+
+
+def limit_argument(value):
+    if value == "auto":
+        return value
+    try:
+        price = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a price or 'auto', got '{value}'")
+    if price <= 0:
+        raise argparse.ArgumentTypeError(f"limit price must be positive, got {value}")
+    return value
+
+
+# --record/--replay/--dry-run, see replay.py.
+def add_replay_arguments(parser):
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', type=str, help='Append every broker request/response to this JSONL file')
+    group.add_argument('--replay', type=str, help='Run offline against responses recorded with --record')
+    parser.add_argument('--dry-run', action='store_true', help='Print the orders about to be submitted but do not submit them')
+    parser.add_argument(
+        '--replay-latency',
+        type=str,
+        default=None,
+        help="With --replay, sleep 'recorded' (the recorded call time) or a fixed number of seconds per call",
+    )
+    parser.add_argument('--replay-accounts', type=int, default=None, help='With --replay, scale the recording to this many accounts')
+
+
+# --journal/--run, see journal.py.
+def add_journal_arguments(parser):
+    parser.add_argument('--journal', type=str, default=None, help='Record orders in this journal and resume unfinished runs from it')
+    parser.add_argument('--run', type=str, default=None, help='Journal run id, default is derived from the trades, quantity, limit and date')
+
+
+# --wait-fills, see fills.py.
+def add_fill_arguments(parser):
+    parser.add_argument(
+        '--wait-fills',
+        type=float,
+        nargs='?',
+        const=120.0,
+        default=None,
+        metavar='SECONDS',
+        help='After submitting, poll the orders until they fill or SECONDS (default 120) pass, then summarize',
+    )
+
+
+# --history, see history.py.
+def add_history_arguments(parser):
+    parser.add_argument(
+        '--history',
+        type=str,
+        nargs='?',
+        const='./history',
+        default=None,
+        metavar='DIR',
+        help="Keep daily price history in DIR (default ./history) and size --limit auto from each symbol's volatility",
+    )
+
+
+# --quote-cache/--quote-ttl, see quote_cache.py.
+def add_quote_cache_arguments(parser):
+    parser.add_argument('--quote-cache', type=str, default=None, metavar='PATH', help='Share quotes between runs through this JSON file')
+    parser.add_argument('--quote-ttl', type=float, default=5.0, help='Seconds a cached quote is served before it is fetched again')
+
+
+# Pre-trade risk check thresholds, see risk.py.
+def add_risk_arguments(parser):
+    parser.add_argument('--no-risk-check', dest='risk_check', action='store_false', help='Send the plan without the pre-trade risk check')
+    parser.add_argument('--max-buy-price', type=float, default=1.0, help='Warn when buying a stock priced above this')
+    parser.add_argument('--min-sell-price', type=float, default=1.0, help='Warn when selling a stock priced below this')
+    parser.add_argument('--limit-band', type=float, default=0.2, help='Block limit orders priced further than this fraction from the last price')
+    parser.add_argument('--max-account-notional', type=float, default=None, help='Block buys once an account would spend more than this')
+
+
+# -v/--trace/--trace-format, see tracing.py.
+def add_trace_arguments(parser):
+    parser.add_argument('-v', '--verbose', action='count', default=0, help='-v logs every broker call, -vv also the payloads')
+    parser.add_argument('--trace', type=str, default=None, help='Write every broker call span to this file')
+    parser.add_argument(
+        '--trace-format',
+        choices=('jsonl', 'chrome'),
+        default='jsonl',
+        help='JSON lines, or Chrome trace events for chrome://tracing and Perfetto',
+    )
+
+
+# Returns the requested (symbol, side) trades in the order given, exiting through
+# parser.error on anything ambiguous.
+def parse_trades(parser, args):
+    default_side = "buy" if args.buy else "sell" if args.sell else None
+
+    entries = [entry.split(":", 1) for entry in args.symbols]
+    if args.file is not None:
+        entries.extend(read_trade_lines(args.file))
+
+    try:
+        return collect_trades(entries, default_side)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+# entries are [symbol] or [symbol, side] lists. Raises ValueError on a missing,
+# unknown or conflicting side, or when no symbols are given at all.
+def collect_trades(entries, default_side=None):
+    trades = {}
+    for entry in entries:
+        symbol = entry[0].strip().upper()
+        side = entry[1].strip().lower() if len(entry) > 1 else default_side
+        if not symbol:
+            continue
+        if side is None:
+            raise ValueError(f"No side for {symbol}: pass --buy/--sell or use {symbol}:buy / {symbol}:sell")
+        if side not in SIDES:
+            raise ValueError(f"Unknown side '{side}' for {symbol}, expected one of {', '.join(SIDES)}")
+        if trades.get(symbol, side) != side:
+            raise ValueError(f"{symbol} is listed as both buy and sell")
+        trades[symbol] = side
+
+    if not trades:
+        raise ValueError("No symbols given")
+    return list(trades.items())
+
+
+def read_trade_lines(path):
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    entries = []
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if line:
+            entries.append(line.replace(":", " ").split())
+    return entries
+
+
+# Build the full account x symbol plan from a PositionIndex (InProgress). Buys go
+# to accounts neither holding the symbol nor with a buy pending, sells to accounts
+# holding it without a sell pending. Each check is an O(1) set lookup.
+def build_plan(account_ids, trades, progress):
+    plan = []
+    for account_id in account_ids:
+        for symbol, side in trades:
+            if side == "buy":
+                wanted = progress.should_buy(account_id, symbol)
+            else:
+                wanted = progress.should_sell(account_id, symbol)
+            if wanted:
+                plan.append(PlannedOrder(account_id, symbol, side))
+    return plan
+
+
+def announce_trades(trades):
+    for symbol, side in trades:
+        if side == "buy":
+            print(f"Buying stock: {symbol}")
+        else:
+            print(f"Selling stock: {symbol}")
+
+
+def report_orders(results, batch_time):
+    for result in results:
+        if result.skipped:
+            print(f"account={result.account_id} {result.side} {result.symbol} skipped")
+        else:
+            print(f"account={result.account_id} {result.side} {result.symbol} "
+                  f"status={result.status_code} latency={result.latency:.3f}s")
+    sent = sum(1 for result in results if not result.skipped)
+    print(f"Submitted {sent}/{len(results)} orders in {batch_time:.3f}s")
@@ -0,0 +1,200 @@
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import json
+import random
+import re
+import threading
+import time
+
+import requests
+
+
+# Local stand-in for the Tradier and Schwab REST endpoints the CLIs use, for
+# benchmarking without a brokerage account. Every account holds HELD_SYMBOL and
+# has no open orders; orders always succeed unless an error is injected.
+#
+#   latency      seconds added to every response, plus up to `jitter` at random
+#   rate_limit   requests per second across all endpoints; over it a 429 with
+#                Retry-After and X-Ratelimit-* headers is returned
+#   error_rate   fraction of requests answered with a 503
+
+
+HELD_SYMBOL = "HELD"
+
+TRADIER_ACCOUNT = re.compile(r"^/v1/accounts/([^/]+)/(positions|orders)$")
+SCHWAB_ORDERS = re.compile(r"^/trader/v1/accounts/([^/]+)/orders$")
+
+
+class MockBroker():
+    def __init__(self, accounts=10, latency=0.0, jitter=0.0, rate_limit=None, error_rate=0.0, seed=0, host="127.0.0.1", port=0):
+        broker = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body in one write; split writes on a keep-alive
+            # connection stall on delayed ACKs and swamp the configured latency.
+            wbufsize = 64 * 1024
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                broker.handle(self, "GET")
+
+            def do_POST(self):
+                broker.handle(self, "POST")
+
+        self.accounts = [f"MOCK{i:05d}" for i in range(accounts)]
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = (0, 0)
+        self.order_ids = 0
+        self.requests = Counter()
+        self.statuses = Counter()
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle(self, handler, method):
+        url = urlparse(handler.path)
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length).decode() if length else ""
+        route = f"{method} {_route(url.path)}"
+
+        with self.lock:
+            self.requests[route] += 1
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            limited = self.over_rate_limit()
+            failed = not limited and self.error_rate and self.random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+
+        headers = {}
+        if limited:
+            status, payload = 429, {"error": "rate limited"}
+            reset = 1 - (time.time() % 1)
+            headers = {
+                "Retry-After": f"{reset:.3f}",
+                "X-Ratelimit-Available": "0",
+                "X-Ratelimit-Expiry": str(int((time.time() + reset) * 1000)),
+            }
+        elif failed:
+            status, payload = 503, {"error": "injected failure"}
+        else:
+            status, payload, headers = self.respond(method, url, body)
+
+        with self.lock:
+            self.statuses[status] += 1
+        data = b"" if payload is None else json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    # Fixed one second window, called with the lock held.
+    def over_rate_limit(self):
+        if self.rate_limit is None:
+            return False
+        second = int(time.time())
+        start, count = self.window
+        if start != second:
+            start, count = second, 0
+        count += 1
+        self.window = (start, count)
+        return count > self.rate_limit
+
+    def next_order_id(self):
+        with self.lock:
+            self.order_ids += 1
+            return self.order_ids
+
+    def respond(self, method, url, body):
+        path = url.path
+        query = parse_qs(url.query)
+
+        # Tradier
+        if path == "/v1/user/profile":
+            accounts = [{"account_number": id, "status": "active"} for id in self.accounts]
+            return 200, {"profile": {"id": "mock", "account": accounts}}, {}
+        match = TRADIER_ACCOUNT.match(path)
+        if match and method == "GET" and match.group(2) == "positions":
+            return 200, {"positions": {"position": {"symbol": HELD_SYMBOL, "quantity": 1.0}}}, {}
+        if match and method == "GET":
+            return 200, {"orders": "null"}, {}
+        if match and method == "POST":
+            return 200, {"order": {"id": self.next_order_id(), "status": "ok"}}, {}
+        if path == "/v1/markets/quotes":
+            symbols = parse_qs(body).get("symbols", query.get("symbols", [""]))[0].split(",")
+            quotes = [{"symbol": symbol, "last": 1.0, "bid": 0.99, "ask": 1.01, "volume": 1000} for symbol in symbols if symbol]
+            return 200, {"quotes": {"quote": quotes}}, {}
+
+        # Schwab
+        if path == "/trader/v1/accounts/accountNumbers":
+            return 200, [{"accountNumber": id, "hashValue": f"HASH{id}"} for id in self.accounts], {}
+        if path == "/trader/v1/accounts":
+            details = []
+            for id in self.accounts:
+                position = {"instrument": {"symbol": HELD_SYMBOL, "assetType": "EQUITY"}, "longQuantity": 1.0}
+                details.append({"securitiesAccount": {"accountNumber": id, "positions": [position]}})
+            return 200, details, {}
+        if path == "/trader/v1/orders":
+            return 200, [], {}
+        match = SCHWAB_ORDERS.match(path)
+        if match and method == "POST":
+            return 201, None, {"Location": f"{self.url}{path}/{self.next_order_id()}"}
+        if path == "/marketdata/v1/quotes":
+            symbols = query.get("symbols", [""])[0].split(",")
+            quotes = {symbol: {"quote": {"lastPrice": 1.0, "bidPrice": 0.99, "askPrice": 1.01, "totalVolume": 1000}} for symbol in symbols if symbol}
+            return 200, quotes, {}
+
+        return 404, {"error": f"no mock for {method} {path}"}, {}
+
+
+# Collapse account ids so request counts group by endpoint.
+def _route(path):
+    path = TRADIER_ACCOUNT.sub(lambda match: f"/v1/accounts/{{id}}/{match.group(2)}", path)
+    return SCHWAB_ORDERS.sub("/trader/v1/accounts/{hash}/orders", path)
+
+
+# The subset of schwabdev.Client that charles.py calls, pointed at a MockBroker.
+# Like schwabdev it makes a fresh request per call rather than pooling.
+class MockSchwabClient():
+    def __init__(self, base_url, hooks=None):
+        self.base_url = base_url
+        self.hooks = hooks or {}
+
+    def account_linked(self):
+        return requests.get(f"{self.base_url}/trader/v1/accounts/accountNumbers", hooks=self.hooks, timeout=10)
+
+    def account_details_all(self, fields=None):
+        return requests.get(f"{self.base_url}/trader/v1/accounts", params={"fields": fields}, hooks=self.hooks, timeout=10)
+
+    def account_orders_all(self, fromEnteredTime, toEnteredTime, maxResults=None, status=None):
+        params = {"fromEnteredTime": fromEnteredTime, "toEnteredTime": toEnteredTime, "maxResults": maxResults, "status": status}
+        return requests.get(f"{self.base_url}/trader/v1/orders", params=params, hooks=self.hooks, timeout=10)
+
+    def order_place(self, accountHash, order):
+        return requests.post(f"{self.base_url}/trader/v1/accounts/{accountHash}/orders", json=order, hooks=self.hooks, timeout=10)
+
+    def quotes(self, symbols=None, fields=None, indicative=False):
+        if isinstance(symbols, list):
+            symbols = ",".join(symbols)
+        return requests.get(f"{self.base_url}/marketdata/v1/quotes", params={"symbols": symbols}, hooks=self.hooks, timeout=10)
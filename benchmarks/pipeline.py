@@ -0,0 +1,229 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from batch import build_plan
+from mock_broker import MockBroker, MockSchwabClient
+from orders import limit_prices
+from ratelimit import RateLimiter, schwab_limiter, tradier_limiter
+
+import charles
+import tradier
+import tracing
+
+
+# End to end benchmark of the account scan -> quote -> plan -> submit pipeline
+# against a local MockBroker, for every combination of account count, symbol
+# count and concurrency. Every account already holds mock_broker.HELD_SYMBOL,
+# so each symbol benchmarked is one buy per account.
+#
+# Prints one JSON object per scenario: wall time per stage, requests issued
+# (by endpoint, including retries), response statuses, and p50/p99 client side
+# latency per call. With --baseline, scenarios more than --tolerance slower than
+# the matching baseline scenario fail the run, so hot path regressions are caught.
+#
+# Schwab orders are placed serially by charles.place_plan, so Schwab scenarios
+# only run at concurrency 1.
+
+DEFAULT_ACCOUNTS = [10, 50]
+DEFAULT_SYMBOLS = [1, 4]
+DEFAULT_CONCURRENCY = [1, 8]
+DEFAULT_LATENCY = 0.01
+DEFAULT_TOLERANCE = 0.25
+
+
+class CallStats():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+
+    # requests response hook: time to response headers of each call.
+    def hook(self, response, *args, **kwargs):
+        with self.lock:
+            self.latencies.append(response.elapsed.total_seconds())
+        return response
+
+    def summary(self):
+        ordered = sorted(self.latencies)
+        return {
+            "calls": len(ordered),
+            "p50_ms": _percentile(ordered, 50) * 1000,
+            "p99_ms": _percentile(ordered, 99) * 1000,
+            "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+        }
+
+
+def _percentile(ordered, percent):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_tradier(mock, trades, concurrency, stats, client_limiter):
+    token = f"benchmark-{time.perf_counter_ns()}"
+    client = tradier.TradierClient(token, base_url=mock.url, limiter=tradier_limiter() if client_limiter else None)
+    client.session.hooks["response"].append(stats.hook)
+    tradier._clients[token] = client
+
+    stages = {}
+    start = time.perf_counter()
+    snapshot = tradier.load_snapshot(token, concurrency)
+    progress = tradier.progress_from_snapshot(snapshot)
+    stages["scan"] = time.perf_counter() - start
+
+    mark = time.perf_counter()
+    prices = limit_prices(trades, "auto", lambda symbols: tradier.share_quotes(token, symbols, concurrency=concurrency))
+    stages["quote"] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    plan = build_plan(snapshot.account_ids, trades, progress)
+    stages["plan"] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    results = tradier.place_plan(token, plan, 1, concurrency, prices)
+    stages["submit"] = time.perf_counter() - mark
+
+    client.close()
+    del tradier._clients[token]
+    return stages, results
+
+
+def run_schwab(mock, trades, concurrency, stats, client_limiter):
+    client = MockSchwabClient(mock.url, hooks={"response": [stats.hook]})
+    charles.LIMITER = schwab_limiter() if client_limiter else RateLimiter({})
+
+    stages = {}
+    start = time.perf_counter()
+    hashes, progress = charles.load_accounts(client)
+    stages["scan"] = time.perf_counter() - start
+
+    mark = time.perf_counter()
+    prices = limit_prices(trades, "auto", lambda symbols: charles.share_quotes(client, symbols))
+    stages["quote"] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    plan = build_plan(list(hashes), trades, progress)
+    stages["plan"] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    results = charles.place_plan(client, hashes, plan, 1, prices)
+    stages["submit"] = time.perf_counter() - mark
+    return stages, results
+
+
+RUNNERS = {
+    "tradier": run_tradier,
+    "schwab": run_schwab,
+}
+
+
+def run_scenario(broker, accounts, symbols, concurrency, args):
+    mock = MockBroker(
+        accounts=accounts,
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit=args.rate_limit,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    ).start()
+    trades = [(f"SYM{i:03d}", "buy") for i in range(symbols)]
+    stats = CallStats()
+    try:
+        start = time.perf_counter()
+        # The CLIs print every request and order; keep that out of the results.
+        with contextlib.redirect_stdout(io.StringIO()):
+            stages, results = RUNNERS[broker](mock, trades, concurrency, stats, args.client_limiter)
+        wall = time.perf_counter() - start
+    finally:
+        mock.stop()
+
+    return {
+        "broker": broker,
+        "accounts": accounts,
+        "symbols": symbols,
+        "concurrency": concurrency,
+        "wall_s": wall,
+        "stages_s": stages,
+        "orders": len(results),
+        "orders_ok": sum(1 for result in results if not result.skipped and not result.failed()),
+        "orders_failed": sum(1 for result in results if not result.skipped and result.failed()),
+        "orders_skipped": sum(1 for result in results if result.skipped),
+        "requests": sum(mock.requests.values()),
+        "requests_by_endpoint": dict(mock.requests),
+        "statuses": {str(status): count for status, count in mock.statuses.items()},
+        "latency": stats.summary(),
+    }
+
+
+def scenario_key(result):
+    return (result["broker"], result["accounts"], result["symbols"], result["concurrency"])
+
+
+def load_baseline(path):
+    with open(path) as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    return {scenario_key(result): result for result in results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scan -> plan -> submit pipeline against a mock broker")
+    parser.add_argument('--broker', action='append', choices=sorted(RUNNERS), help='Broker(s) to benchmark, default all')
+    parser.add_argument('--accounts', type=int, nargs='+', default=DEFAULT_ACCOUNTS, help='Account counts')
+    parser.add_argument('--symbols', type=int, nargs='+', default=DEFAULT_SYMBOLS, help='Symbol counts')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=DEFAULT_CONCURRENCY, help='Concurrency levels (1 is serial)')
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help='Mock response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency, up to this many seconds')
+    parser.add_argument('--rate-limit', type=int, default=None, help='Mock requests per second before 429s')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of mock responses that are 503s')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for jitter and error injection')
+    parser.add_argument('--client-limiter', action='store_true', help="Use the brokers' client side rate limiters")
+    parser.add_argument('--output', type=str, default=None, help='Also write the JSON lines to this file')
+    parser.add_argument('--baseline', type=str, default=None, help='JSON lines from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Allowed slowdown over the baseline')
+    args = parser.parse_args()
+
+    # Per call log lines would only measure the terminal.
+    tracing.configure(0)
+    baseline = load_baseline(args.baseline) if args.baseline else {}
+    output = open(args.output, "w") if args.output else None
+    regressions = []
+    for broker in args.broker or sorted(RUNNERS):
+        for accounts, symbols, concurrency in itertools.product(args.accounts, args.symbols, args.concurrency):
+            if broker == "schwab" and concurrency != 1:
+                continue
+            result = run_scenario(broker, accounts, symbols, concurrency, args)
+            previous = baseline.get(scenario_key(result))
+            if previous is not None:
+                result["baseline_wall_s"] = previous["wall_s"]
+                result["regressed"] = result["wall_s"] > previous["wall_s"] * (1 + args.tolerance)
+                if result["regressed"]:
+                    regressions.append(result)
+            line = json.dumps(result)
+            print(line)
+            if output is not None:
+                output.write(line + "\n")
+    if output is not None:
+        output.close()
+
+    if regressions:
+        for result in regressions:
+            print(
+                f"{result['broker']} accounts={result['accounts']} symbols={result['symbols']} "
+                f"concurrency={result['concurrency']}: {result['wall_s']:.3f}s vs baseline {result['baseline_wall_s']:.3f}s",
+                file=sys.stderr,
+            )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
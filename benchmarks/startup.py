@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+# Cold start benchmark for the CLIs. Measures the wall time of `<script> --help`
+# in a fresh interpreter (import + argument parsing, no network) and the
+# cumulative import time of the module as reported by `python -X importtime`.
+# Prints one JSON object per script and exits non-zero if any median wall time
+# is over --budget-ms, so it can gate changes that slow startup down.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCRIPTS = ["charles.py", "tradier.py"]
+DEFAULT_RUNS = 10
+DEFAULT_BUDGET_MS = 300
+
+
+def help_wall_times(script, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, script, "--help"],
+            cwd=REPO_DIR,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+# Cumulative import time (ms) of the module itself, including everything it pulls in.
+def import_time(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLI cold start time")
+    parser.add_argument('scripts', nargs='*', default=DEFAULT_SCRIPTS, help='Scripts to measure')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help='Runs per script')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help='Median wall time budget')
+    args = parser.parse_args()
+
+    over_budget = False
+    for script in args.scripts:
+        times = help_wall_times(script, args.runs)
+        median = statistics.median(times)
+        result = {
+            "script": script,
+            "runs": args.runs,
+            "help_median_ms": round(median, 1),
+            "help_max_ms": round(max(times), 1),
+            "import_ms": import_time(os.path.splitext(script)[0]),
+            "budget_ms": args.budget_ms,
+            "within_budget": median <= args.budget_ms,
+        }
+        over_budget = over_budget or not result["within_budget"]
+        print(json.dumps(result))
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
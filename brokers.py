@@ -0,0 +1,164 @@
+from account_registry import DEFAULT_REGISTRY_PATH, AccountRegistry, filter_plan
+from streaming import QuoteStream
+
+import charles
+import tradier
+
+
+# Common interface over the Schwab and Tradier backends so one plan can be run
+# against either (or both at once, see stonks.py).
+#
+#   snapshot()                 -> (account_ids, PositionIndex) for every account
+#   quotes(symbols)            -> symbol -> {"last", "bid", "ask", "volume"}
+#   place_order(order, qty)    -> OrderResult for a single PlannedOrder
+#   place_plan(plan, qty)      -> OrderResults, stopping at the first failure
+#   reconciler                 -> an object with fetch()/apply(changes, index)
+#                                 that keeps a snapshot's open orders current,
+#                                 or None
+#
+# place_order/place_plan take an optional symbol -> limit price mapping; symbols
+# without a price get market orders.
+class Broker():
+    name = None
+    reconciler = None
+
+    def snapshot(self):
+        raise NotImplementedError
+
+    def account_ids(self):
+        return self.snapshot()[0]
+
+    def quotes(self, symbols):
+        raise NotImplementedError
+
+    def place_order(self, order, quantity, prices=None):
+        return self.place_plan([order], quantity, prices)[0]
+
+    def place_plan(self, plan, quantity, prices=None):
+        raise NotImplementedError
+
+
+class TradierBroker(Broker):
+    name = "tradier"
+
+    def __init__(self, token, concurrency=1):
+        self.token = token
+        self.concurrency = concurrency
+        self.quote_stream = None
+        # Create the shared client with a pool big enough for the concurrency.
+        tradier.get_client(token, concurrency)
+
+    # Serve quotes from a live streaming.QuoteStream instead of polling. Symbols
+    # are subscribed on first request; until the stream has a recent quote for
+    # them, or while it is disconnected, they are fetched over REST.
+    def stream_quotes(self, api_url=tradier.API_URL):
+        self.quote_stream = QuoteStream(self.token, api_url=api_url)
+        self.quote_stream.start()
+
+    def snapshot(self):
+        snapshot = tradier.load_snapshot(self.token)
+        return snapshot.account_ids, tradier.progress_from_snapshot(snapshot)
+
+    def quotes(self, symbols):
+        if self.quote_stream is None:
+            return tradier.share_quotes(self.token, symbols)
+        self.quote_stream.subscribe(symbols)
+        found = {symbol: quote for symbol, quote in self.quote_stream.quotes(symbols).items() if quote["last"] is not None}
+        missing = [symbol for symbol in symbols if symbol not in found]
+        if missing:
+            found.update(tradier.share_quotes(self.token, missing))
+        return found
+
+    def place_plan(self, plan, quantity, prices=None):
+        return tradier.place_plan(self.token, plan, quantity, self.concurrency, prices)
+
+
+class SchwabBroker(Broker):
+    name = "schwab"
+
+    def __init__(self, app_key, app_secret, tokens_file=charles.DEFAULT_TOKENS_FILE, registry_path=DEFAULT_REGISTRY_PATH):
+        self.client = charles.get_client(app_key, app_secret, tokens_file)
+        # account number -> hash, filled in by snapshot()
+        self.hashes = {}
+        self.registry = AccountRegistry(registry_path)
+        self.reconciler = charles.OrderReconciler(self.client)
+
+    def snapshot(self):
+        # The reconciler's full pull doubles as the snapshot's open orders.
+        orders = self.reconciler.refresh()
+        self.hashes, progress = charles.load_accounts(self.client, orders, self.registry)
+        self.reconciler.hashes = self.hashes
+        return tuple(self.hashes), progress
+
+    def quotes(self, symbols):
+        return charles.share_quotes(self.client, symbols)
+
+    def place_plan(self, plan, quantity, prices=None):
+        if not self.hashes:
+            self.snapshot()
+        plan = filter_plan(self.registry, plan)
+        return charles.place_plan(self.client, self.hashes, plan, quantity, prices)
+
+
+BROKERS = ("tradier", "schwab")
+
+# Every credential set for a broker in the environment, as keyword arguments
+# for make_broker. The usual variables are the first set; further logins add
+# a numbered suffix starting at 2 (TRADIER_ACCESS_TOKEN_2, CHARLES_ACCESS_KEY_2
+# and CHARLES_SECRET_KEY_2, ...), and their Schwab tokens and account registry
+# get files of their own.
+def credentials_from_env(name, getenv):
+    if name not in BROKERS:
+        raise ValueError(f"Unknown broker '{name}', expected one of {', '.join(BROKERS)}")
+    found = []
+    while True:
+        suffix = "" if not found else f"_{len(found) + 1}"
+        if name == "tradier":
+            token = getenv(f'TRADIER_ACCESS_TOKEN{suffix}')
+            if not token and found:
+                return found
+            found.append({"token": token})
+        else:
+            app_key = getenv(f'CHARLES_ACCESS_KEY{suffix}')
+            if not app_key and found:
+                return found
+            credentials = {"app_key": app_key, "app_secret": getenv(f'CHARLES_SECRET_KEY{suffix}')}
+            if suffix:
+                credentials["tokens_file"] = f"tokens{suffix}.json"
+                credentials["registry_path"] = DEFAULT_REGISTRY_PATH.replace(".json", f"{suffix}.json")
+            found.append(credentials)
+
+
+# The brokers with credentials in the environment, in BROKERS order.
+def configured_brokers(getenv):
+    found = []
+    if getenv('TRADIER_ACCESS_TOKEN'):
+        found.append("tradier")
+    if getenv('CHARLES_ACCESS_KEY') and getenv('CHARLES_SECRET_KEY'):
+        found.append("schwab")
+    return found
+
+
+# --broker names from the arguments, or every configured broker without them.
+# Exits through parser.error when a broker has no credentials.
+def selected_brokers(parser, names, getenv):
+    configured = configured_brokers(getenv)
+    if not names:
+        if not configured:
+            parser.error("No broker credentials in the environment, set TRADIER_ACCESS_TOKEN or CHARLES_ACCESS_KEY/CHARLES_SECRET_KEY")
+        return configured
+    missing = [name for name in names if name not in configured]
+    if missing:
+        parser.error(f"No credentials in the environment for {', '.join(missing)}")
+    return list(dict.fromkeys(names))
+
+
+def make_broker(name, credentials, concurrency=1):
+    if name == "tradier":
+        return TradierBroker(credentials["token"], concurrency)
+    return SchwabBroker(**credentials)
+
+
+# Build the named brokers from the usual environment variables.
+def brokers_from_env(names, getenv, concurrency=1):
+    return {name: make_broker(name, credentials_from_env(name, getenv)[0], concurrency) for name in names}
@@ -1,11 +1,34 @@
+from account_registry import DEFAULT_REGISTRY_PATH, AccountRegistry, filter_plan
+from concurrent.futures import ThreadPoolExecutor
+from batch import (
+    OrderResult,
+    add_batch_arguments,
+    add_fill_arguments,
+    add_history_arguments,
+    add_journal_arguments,
+    add_replay_arguments,
+    add_risk_arguments,
+    add_trace_arguments,
+    announce_trades,
+    build_plan,
+    parse_trades,
+    report_orders,
+)
 from dotenv import load_dotenv
-from schwab import auth, client
-import schwabdev
+from journal import journaled_plan, open_journal
+from orders import priced_plan, schwab_order
+from payloads import response_json, schwab_holdings
+from positions import PositionIndex, normalize_side
+from ratelimit import ACCOUNT, MARKET, RATE_LIMIT_RETRIES, TRADING, RateLimiter, schwab_limiter
+from risk import risk_limits
+from tracing import TRACER, logger
 
-from typing import Optional
 import argparse
-import json
+import datetime
 import os
+import threading
+import time
+import tracing
 
 ## Goals
 
@@ -21,145 +44,432 @@ import os
 ## Post a warning if stock below certain limit (less $1)
 ## Handle errors: terminate if any error.
 
-## Idea: Dry run. Print the requests about to be submitted but don't submit them yet.
-## Good as a testing utility while developing.
+## Dry run: --dry-run prints the requests about to be submitted but doesn't submit them.
+## --record/--replay capture broker responses and plan offline against them (see replay.py).
+## The $1 warnings, limit price bands and per account spend caps run as one
+## pre-trade risk check over the whole plan (see risk.py).
 
 ## Idea: Implement optional limit orders: --limit 0.15
 ## Absence of --limit flag would assume a market order.
 
-def design_order(
-    symbol,
-    order_type,
-    instruction,
-    quantity,
-    leg_id,
-    order_leg_type,
-    asset_type,
-    price: Optional[str] = None,
-    session="NORMAL",
-    duration="DAY",
-    complex_order_strategy_type="NONE",
-    tax_lot_method="FIFO",
-    position_effect="OPENING",
-    # special_instruction="ALL_OR_NONE",
-    order_strategy_type="SINGLE",
-):
-    post_order_payload = {
-        "price": price,
-        "session": session,
-        "duration": duration,
-        "orderType": order_type,
-        "complexOrderStrategyType": complex_order_strategy_type,
-        "quantity": quantity,
-        "taxLotMethod": tax_lot_method,
-        "orderLegCollection": [
-            {
-                "orderLegType": order_leg_type,
-                "legId": leg_id,
-                "instrument": {
-                    "symbol": symbol,
-                    "assetType": asset_type,
-                },
-                "instruction": instruction,
-                "positionEffect": position_effect,
-                "quantity": quantity,
-            }
-        ],
-        "orderStrategyType": order_strategy_type,
-    }
-
-    return post_order_payload
-
-
-class InProgress():
-    def __init__(self, acctPositions, orders):
-        self.positions = {}
-        for account in acctPositions:
-            accountNumber = account['securitiesAccount']['accountNumber']
-            positions = account['securitiesAccount'].get('positions')
-            self.positions[accountNumber] = []
-            # TODO: Implement storage of account positions and open orders to track which trades are
-            # already in progress.
-            if positions is None:
+# Schwab order statuses that mean the order can still fill.
+OPEN_ORDER_STATUSES = (
+    "AWAITING_PARENT_ORDER",
+    "AWAITING_CONDITION",
+    "AWAITING_STOP_CONDITION",
+    "AWAITING_MANUAL_REVIEW",
+    "AWAITING_UR_OUT",
+    "AWAITING_RELEASE_TIME",
+    "ACCEPTED",
+    "PENDING_ACTIVATION",
+    "PENDING_ACKNOWLEDGEMENT",
+    "PENDING_REPLACE",
+    "QUEUED",
+    "WORKING",
+    "NEW",
+)
+
+
+# accounts and holdings as returned by payloads.schwab_holdings.
+class InProgress(PositionIndex):
+    def __init__(self, accounts, holdings, orders):
+        super().__init__()
+        for accountNumber in accounts:
+            self.add_account(accountNumber)
+        for holding in holdings:
+            self.add_position(holding.account_id, holding.symbol, holding.quantity)
+        self.addOrders(orders or [])
+
+    def addOrders(self, orders):
+        for order in orders:
+            if order.get('status') not in OPEN_ORDER_STATUSES:
                 continue
-            for position in positions:
-                symbol = position['instrument']['symbol']
-                self.positions[accountNumber].append(symbol)
-        self.orders = orders
+            accountNumber = str(order['accountNumber'])
+            for leg in order.get('orderLegCollection', []):
+                self.add_open_order(accountNumber, leg['instrument']['symbol'], leg['instruction'])
 
     def isInProgress(self, accountNumber, symbol):
-        # TODO: Implement
-        accountSymbols = self.positions[accountNumber]
-        return symbol in accountSymbols
-
-
-def buyStock(client, accountHash, symbol, quantity):
-    post_order_payload = design_order(
-        symbol,
-        order_type="MARKET",
-        instruction="BUY",
-        quantity=f"{quantity}",
-        leg_id="1",
-        order_leg_type="EQUITY",
-        asset_type="EQUITY",
-    )
-    print(json.dumps(post_order_payload))
-    resp = client.order_place(accountHash=accountHash, order=post_order_payload)
-    code = resp.status_code
-    print(code)
-    body = json.dumps(resp.text)
-    print(body)
+        return self.holds(accountNumber, symbol) or self.has_open_order(accountNumber, symbol)
+
+
+# Every schwabdev call goes through the shared limiter. Orders take priority
+# over account and quote requests when the per-app budget runs short, and a 429
+# (which Schwab rejects before acting on) is waited out and retried.
+# Each call is timed as a tracing span.
+LIMITER = schwab_limiter()
+
+def limited(endpoint_class, call, *args, **kwargs):
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        LIMITER.acquire(endpoint_class)
+        with TRACER.span("schwab", call.__name__, kwargs.get('accountHash')) as span:
+            resp = call(*args, **kwargs)
+            span.response(resp)
+        LIMITER.observe(endpoint_class, resp)
+        if resp.status_code != 429:
+            break
+        logger.warning("{} call rate limited, waiting for the limiter", endpoint_class)
     return resp
 
-def sellStock(client, accountHash, symbol, quantity):
-    post_order_payload = design_order(
-        symbol,
-        order_type="MARKET",
-        instruction="SELL",
-        quantity=f"{quantity}",
-        leg_id="1",
-        order_leg_type="EQUITY",
-        asset_type="EQUITY",
-    )
-    print(json.dumps(post_order_payload))
-    resp = client.order_place(accountHash=accountHash, order=post_order_payload)
-    code = resp.status_code
-    print(code)
-    body = json.dumps(resp.text)
-    print(body)
-    return resp
 
-def main():
-    load_dotenv()
+def buyStock(client, accountHash, symbol, quantity, price=None):
+    return placeStock(client, accountHash, symbol, "BUY", quantity, price)
 
-    app_key = os.getenv('CHARLES_ACCESS_KEY')
-    app_secret = os.getenv('CHARLES_SECRET_KEY')
-    callback_url = 'https://127.0.0.1:8182/'
-    token_path = './token.json'
+def sellStock(client, accountHash, symbol, quantity, price=None):
+    return placeStock(client, accountHash, symbol, "SELL", quantity, price)
 
-    ## Schwabdev
-    client = schwabdev.Client(app_key, app_secret)
-    accounts = client.account_linked().json()
-    print(accounts)
+# Market order when price is None, otherwise a limit order at that price.
+def placeStock(client, accountHash, symbol, instruction, quantity, price=None):
+    payload = schwab_order(symbol, instruction, quantity, price)
+    logger.debug("order {}", payload)
+    # schwabdev encodes the order itself, so it is handed the object form.
+    resp = limited(TRADING, client.order_place, accountHash=accountHash, order=payload.order)
+    logger.trace("status={} {}", resp.status_code, resp.text)
+    return resp
 
-    details = client.account_details_all(fields='positions').json()
-    json_string = json.dumps(details)
-    # print(json_string)
 
-    # # TODO: Figure out how to check open orders for all accounts.
-    # orders = client.account_orders_all().json()
-    # json_string = json.dumps(details)
+# Schwab answers a placed order with an empty body and
+# Location: .../accounts/{accountHash}/orders/{orderId}
+def order_id(resp):
+    location = resp.headers.get('Location')
+    if not location:
+        return None
+    return location.rstrip('/').rsplit('/', 1)[-1]
+
+
+# symbol -> {"last", "bid", "ask", "volume"}, the same shape as tradier.share_quotes.
+def share_quotes(client, symbols):
+    data = limited(MARKET, client.quotes, list(symbols)).json()
+    quotes = {}
+    for symbol, entry in data.items():
+        quote = entry.get('quote')
+        if quote is None:
+            continue
+        quotes[symbol] = {
+            "last": quote.get('lastPrice'),
+            "bid": quote.get('bidPrice'),
+            "ask": quote.get('askPrice'),
+            "volume": quote.get('totalVolume'),
+        }
+    return quotes
+
+
+# Price history frequency -> price_history arguments.
+HISTORY_PARAMS = {
+    "daily": {"periodType": "year", "frequencyType": "daily", "frequency": 1},
+    "minute": {"periodType": "day", "frequencyType": "minute", "frequency": 1},
+}
+
+# OHLCV candles for history.PriceHistory.update, from start_ms until now.
+def price_candles(client, symbol, frequency, start_ms):
+    start = datetime.datetime.fromtimestamp(start_ms / 1000, datetime.timezone.utc)
+    end = datetime.datetime.now(datetime.timezone.utc)
+    resp = limited(MARKET, client.price_history, symbol, startDate=start, endDate=end, **HISTORY_PARAMS[frequency])
+    resp.raise_for_status()
+    candles = response_json(resp).get('candles') or []
+    return [
+        {
+            "time": candle['datetime'],
+            "open": candle['open'],
+            "high": candle['high'],
+            "low": candle['low'],
+            "close": candle['close'],
+            "volume": candle.get('volume', 0),
+        }
+        for candle in candles
+    ]
+
+
+_client = None
+# schwabdev's own default; each extra Schwab login needs its own file.
+DEFAULT_TOKENS_FILE = "tokens.json"
+
+# schwabdev.Client persists and refreshes its own tokens; keep one instance per
+# process so repeated calls (and a long running service) reuse it.
+# schwabdev is imported here rather than at module level so --help and argument
+# errors do not pay for loading it.
+def get_client(app_key, app_secret, tokens_file=DEFAULT_TOKENS_FILE):
+    global _client
+    if _client is None:
+        import schwabdev
+        _client = schwabdev.Client(app_key, app_secret, tokens_file=tokens_file)
+    return _client
+
+
+# Account number -> hash for every linked account.
+def account_hashes(client):
+    accounts = limited(ACCOUNT, client.account_linked).json()
+    logger.trace("linked accounts {}", accounts)
+    return {account['accountNumber']: account['hashValue'] for account in accounts}
+
+
+# Fetch the linked accounts and their type and flags into an
+# account_registry.AccountRegistry, without positions.
+def refresh_registry(client, registry):
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        linked = pool.submit(limited, ACCOUNT, client.account_linked)
+        details = pool.submit(limited, ACCOUNT, client.account_details_all)
+        registry.update(response_json(linked.result()), response_json(details.result()))
+    return registry
+
+
+# Account number -> hash from the registry, refreshing it first only when stale.
+def registry_hashes(client, registry):
+    if not registry.fresh():
+        refresh_registry(client, registry)
+    return registry.hashes()
+
+
+# Open orders for every linked account come from account_orders_all, which
+# covers all accounts in one call but filters on entered time only and returns
+# at most ORDERS_PAGE_SIZE orders. The lookback is cut into windows fetched in
+# parallel, and a window that comes back full is split in half and refetched
+# until every order in it fits on a page.
+ORDERS_PAGE_SIZE = 3000
+ORDER_WINDOW = datetime.timedelta(days=1)
+MIN_ORDER_WINDOW = datetime.timedelta(minutes=1)
+# GTC orders stay open for a long time; older ones are picked up by the
+# positions they produce rather than as open orders.
+DEFAULT_ORDER_LOOKBACK = datetime.timedelta(days=7)
+ORDER_FETCH_CONCURRENCY = 4
+
+
+def schwab_time(moment):
+    return moment.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+# "2024-03-01T14:30:00+0000"
+def parse_schwab_time(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S%z")
+
+
+def fetch_orders(client, start, end, page_size=ORDERS_PAGE_SIZE):
+    resp = limited(
+        ACCOUNT,
+        client.account_orders_all,
+        fromEnteredTime=schwab_time(start),
+        toEnteredTime=schwab_time(end),
+        maxResults=page_size,
+    )
+    resp.raise_for_status()
+    orders = resp.json()
+    if len(orders) < page_size or end - start <= MIN_ORDER_WINDOW:
+        return orders
+    middle = start + (end - start) / 2
+    return fetch_orders(client, start, middle, page_size) + fetch_orders(client, middle, end, page_size)
+
+
+# Every order, in any status, entered between start and end, by order id.
+def bulk_orders(client, start, end, window=ORDER_WINDOW, concurrency=ORDER_FETCH_CONCURRENCY):
+    windows = []
+    while start < end:
+        windows.append((start, min(start + window, end)))
+        start += window
+    found = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(windows)))) as pool:
+        for orders in pool.map(lambda bounds: fetch_orders(client, *bounds), windows):
+            # Window edges are inclusive, so an order can show up twice.
+            for order in orders:
+                found[order['orderId']] = order
+    return found
+
+
+# order id -> status of every order entered since `since`, across all linked
+# accounts in one call, for fills.FillMonitor.
+def order_statuses(client, since):
+    end = datetime.datetime.now(datetime.timezone.utc)
+    return {str(order_id): order.get('status', '') for order_id, order in bulk_orders(client, since, end).items()}
+
+
+def open_orders(client, lookback=DEFAULT_ORDER_LOOKBACK):
+    end = datetime.datetime.now(datetime.timezone.utc)
+    orders = bulk_orders(client, end - lookback, end)
+    return [order for order in orders.values() if order.get('status') in OPEN_ORDER_STATUSES]
+
+
+# Keeps an InProgress index in step with order status changes without reloading
+# everything. Schwab can only filter orders by entered time, so each poll asks
+# account_orders_all for the orders entered since the previous poll only, and
+# looks up each order that was still open at the previous poll with one
+# order_details call. A long resting GTC order costs one call a poll instead of
+# re-reading every day since it was entered. Orders in accounts without a known
+# hash fall back to reading the windows back to their entry.
+#
+# fetch() does the network calls and returns the changes; apply() writes them
+# into an index, so callers can hold their own lock for just the apply.
+# Open orders are added or removed. A fill seen here (the order was open at the
+# previous poll) also adds or removes the position, so the index stays right
+# until the next full reload.
+class OrderReconciler():
+    # Entered times are second resolution and clocks drift; re-read a little
+    # before the previous poll.
+    OVERLAP = datetime.timedelta(minutes=1)
+
+    def __init__(self, client, lookback=DEFAULT_ORDER_LOOKBACK):
+        self.client = client
+        self.lookback = lookback
+        # orderId -> (status, entered time, account number) for orders that
+        # were open last poll.
+        self.open = {}
+        self.last_poll = None
+        # account number -> hash, for order_details; set by the owner once
+        # the accounts are loaded.
+        self.hashes = {}
+        # refresh() and fetch() run from different threads (a service's reload
+        # and reconcile loops); one poll at a time keeps open and last_poll in
+        # step. Reentrant because fetch() starts with a refresh().
+        self.lock = threading.RLock()
+
+    # Full pull over the lookback; returns the open orders and resets the
+    # tracked state to them.
+    def refresh(self):
+        with self.lock:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            orders = [order for order in bulk_orders(self.client, now - self.lookback, now).values() if order.get('status') in OPEN_ORDER_STATUSES]
+            self.open = {order['orderId']: self.tracked(order) for order in orders}
+            self.last_poll = now
+            return orders
+
+    @staticmethod
+    def tracked(order):
+        return (order['status'], parse_schwab_time(order['enteredTime']), str(order['accountNumber']))
+
+    def order_details(self, order_id):
+        status, entered, account = self.open[order_id]
+        resp = limited(ACCOUNT, self.client.order_details, accountHash=self.hashes[account], orderId=order_id)
+        resp.raise_for_status()
+        return resp.json()
+
+    # (order, previous status or None) for every order whose status changed.
+    def fetch(self):
+        with self.lock:
+            if self.last_poll is None:
+                return [(order, None) for order in self.refresh()]
+            now = datetime.datetime.now(datetime.timezone.utc)
+            start = self.last_poll - self.OVERLAP
+            found = bulk_orders(self.client, start, now)
+            older = [order_id for order_id in self.open if order_id not in found]
+            unhashed = [order_id for order_id in older if self.open[order_id][2] not in self.hashes]
+            if unhashed:
+                oldest = min(self.open[order_id][1] for order_id in unhashed)
+                found.update(bulk_orders(self.client, oldest, start))
+            lookups = [order_id for order_id in older if order_id not in found]
+            if lookups:
+                with ThreadPoolExecutor(max_workers=max(1, min(ORDER_FETCH_CONCURRENCY, len(lookups)))) as pool:
+                    for order in pool.map(self.order_details, lookups):
+                        found[order['orderId']] = order
+            changes = []
+            for order_id, order in found.items():
+                status = order.get('status')
+                previous = self.open.get(order_id, (None, None, None))[0]
+                if status == previous:
+                    continue
+                if status in OPEN_ORDER_STATUSES:
+                    self.open[order_id] = self.tracked(order)
+                elif previous is None:
+                    # Entered and finished between polls; positions catch up on reload.
+                    continue
+                else:
+                    del self.open[order_id]
+                changes.append((order, previous))
+            self.last_poll = now
+            return changes
+
+    def apply(self, changes, progress):
+        for order, previous in changes:
+            accountNumber = str(order['accountNumber'])
+            is_open = order.get('status') in OPEN_ORDER_STATUSES
+            filled = order.get('status') == 'FILLED' and previous in OPEN_ORDER_STATUSES
+            for leg in order.get('orderLegCollection', []):
+                symbol = leg['instrument']['symbol']
+                instruction = leg['instruction']
+                if is_open:
+                    progress.add_open_order(accountNumber, symbol, instruction)
+                    continue
+                progress.remove_open_order(accountNumber, symbol, instruction)
+                if filled and normalize_side(instruction) == "buy":
+                    progress.add_position(accountNumber, symbol, leg.get('quantity', 1))
+                elif filled:
+                    progress.remove_position(accountNumber, symbol, leg.get('quantity'))
+
+    def poll(self, progress):
+        changes = self.fetch()
+        self.apply(changes, progress)
+        return changes
+
+
+# Account number -> hash, and the positions index for every linked account,
+# including open orders (fetched in bulk unless given).
+def load_accounts(client, orders=None, registry=None):
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        if registry is None:
+            hashes = pool.submit(account_hashes, client)
+        else:
+            hashes = pool.submit(registry_hashes, client, registry)
+        details = pool.submit(limited, ACCOUNT, client.account_details_all, fields='positions')
+        if orders is None:
+            orders = pool.submit(open_orders, client).result()
+        hashes = hashes.result()
+        # Only account numbers, symbols and quantities are kept from what can
+        # be a very large document.
+        accounts, holdings = schwab_holdings(details.result().content)
+    progress = InProgress(accounts, holdings, orders)
+    return hashes, progress
+
+
+# Place every order in the plan in sequence, stopping at the first response
+# with status >= 300, or without a response at all. Orders after that point
+# are reported as skipped.
+# prices maps symbol -> limit price; symbols without one get market orders.
+# With a journal.OrderJournal every submission and outcome is journaled.
+def place_plan(client, hashes, plan, quantity, prices=None, journal=None):
+    import requests
+
+    prices = prices or {}
+    results = []
+    stopped = False
+    batch_start = time.perf_counter()
+    for order in plan:
+        if stopped:
+            results.append(OrderResult(order.account_id, order.symbol, order.side, skipped=True))
+            continue
+        hash_val = hashes[order.account_id]
+        logger.debug("account={} {} {}", order.account_id, order.side, order.symbol)
+
+        if journal is not None:
+            journal.sending(order)
+        start = time.perf_counter()
+        try:
+            if order.side == "buy":
+                resp = buyStock(client=client, accountHash=hash_val, symbol=order.symbol, quantity=quantity, price=prices.get(order.symbol))
+            else:
+                resp = sellStock(client=client, accountHash=hash_val, symbol=order.symbol, quantity=quantity, price=prices.get(order.symbol))
+        except requests.RequestException as e:
+            # The order may or may not have reached Schwab: no status, which
+            # the journal records as unknown, and the rest of the plan stops.
+            logger.error("account={} {} {} failed: {}", order.account_id, order.side, order.symbol, e)
+            result = OrderResult(order.account_id, order.symbol, order.side, None, time.perf_counter() - start)
+            if journal is not None:
+                journal.finished(result)
+            results.append(result)
+            stopped = True
+            continue
+        latency = time.perf_counter() - start
+        result = OrderResult(order.account_id, order.symbol, order.side, resp.status_code, latency, order_id=order_id(resp))
+        if journal is not None:
+            journal.finished(result)
+        results.append(result)
+        stopped = result.failed()
+    report_orders(results, time.perf_counter() - batch_start)
+    return results
 
-    # Create the parser object
-    parser = argparse.ArgumentParser(description="Process stock transactions: buy or sell a stock")
 
-    # Add mutually exclusive group for --buy and --sell
-    group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument('--buy', action='store_true', help='Buy a stock')
-    group.add_argument('--sell', action='store_true', help='Sell a stock')
+def main():
+    # Create the parser object. Arguments are parsed and validated before any
+    # broker library is imported or network call made, so mistakes fail fast.
+    parser = argparse.ArgumentParser(description="Process stock transactions: buy or sell stocks")
 
-    # Add the stock symbol argument
-    parser.add_argument('symbol', type=str, help='The stock symbol to buy or sell')
+    # --buy/--sell, the symbols and the --file batch input
+    add_batch_arguments(parser)
 
     parser.add_argument(
         '--quantity',
@@ -168,32 +478,109 @@ def main():
         help='Stock quantity',
     )
 
+    # --dry-run, --record and --replay
+    add_replay_arguments(parser)
+
+    # --journal and --run
+    add_journal_arguments(parser)
+
+    # --no-risk-check and the risk thresholds
+    add_risk_arguments(parser)
+
+    # --wait-fills
+    add_fill_arguments(parser)
+
+    # --history
+    add_history_arguments(parser)
+
+    parser.add_argument('--registry', type=str, default=DEFAULT_REGISTRY_PATH, help='Cached account registry, see account_registry.py')
+    parser.add_argument('--refresh-accounts', action='store_true', help='Refresh the account registry before trading')
+    parser.add_argument('--tag', action='append', help='Only trade accounts with this registry tag, may be repeated')
+
+    # -v, --trace and --trace-format
+    add_trace_arguments(parser)
+
     # Parse the arguments
     args = parser.parse_args()
+    trades = parse_trades(parser, args)
+    if args.tag and args.replay is not None:
+        parser.error("--tag needs the account registry, which is not used with --replay")
+
+    tracing.start(args)
+
+    load_dotenv()
 
-    # Handle buy or sell action
-    if args.buy:
-        print(f"Buying stock: {args.symbol}")
-    elif args.sell:
-        print(f"Selling stock: {args.symbol}")
-
-    progress = InProgress(acctPositions=details, orders=None)
-
-    for account in accounts:
-        account_num = account['accountNumber']
-        hash_val = account['hashValue']
-
-        stockInProgress = progress.isInProgress(accountNumber=account_num, symbol=args.symbol)
-        print(account_num, stockInProgress)
-
-        if args.buy and not stockInProgress:
-            resp = buyStock(client=client, accountHash=hash_val, symbol=args.symbol, quantity=args.quantity)
-            if resp.status_code >= 300:
-                break
-        elif args.sell and stockInProgress:
-            resp = sellStock(client=client, accountHash=hash_val, symbol=args.symbol, quantity=args.quantity)
-            if resp.status_code >= 300:
-                break
+    app_key = os.getenv('CHARLES_ACCESS_KEY')
+    app_secret = os.getenv('CHARLES_SECRET_KEY')
+    callback_url = 'https://127.0.0.1:8182/'
+    token_path = './token.json'
+    if args.replay is None and (not app_key or not app_secret):
+        parser.error("CHARLES_ACCESS_KEY and CHARLES_SECRET_KEY must be set")
+
+    announce_trades(trades)
+
+    ## Schwabdev
+    # replay pulls in requests, so like schwabdev it is only imported once the
+    # arguments are known good.
+    from replay import schwab_client
+    if args.replay is not None:
+        # Offline: nothing to rate limit, --replay-latency sets the pace.
+        global LIMITER
+        LIMITER = RateLimiter({})
+    client = schwab_client(lambda: get_client(app_key, app_secret), args)
+
+    # Hashes come from the registry while it is fresh, saving the
+    # account_linked call. Replays use the recorded accounts instead.
+    registry = None if args.replay is not None else AccountRegistry(args.registry)
+    if registry is not None and args.refresh_accounts:
+        refresh_registry(client, registry)
+
+    hashes = {}
+
+    def scan():
+        found, progress = load_accounts(client, registry=registry)
+        hashes.update(found)
+        return build_plan(list(found), trades, progress)
+
+    # A journaled run that was started before resumes without the positions
+    # scan; only the account hashes are looked up again.
+    journal = open_journal(args, "schwab", trades)
+    plan = scan() if journal is None else journaled_plan(journal, scan)
+    if not hashes:
+        hashes = account_hashes(client) if registry is None else registry_hashes(client, registry)
+    if registry is not None:
+        plan = filter_plan(registry, plan, args.tag)
+
+    # --limit auto pads from each symbol's stored price history, filled in
+    # incrementally. numpy is only imported when the history is used.
+    multipliers = None
+    if args.history is not None and args.limit == "auto":
+        from history import PriceHistory, history_multipliers
+        fetch = lambda symbol, frequency, start: price_candles(client, symbol, frequency, start)
+        multipliers = history_multipliers(PriceHistory(args.history), trades, fetch)
+
+    # Limit prices and the pre-trade risk check share one quote fetch.
+    try:
+        plan, prices = priced_plan(plan, trades, args.quantity, args.limit, lambda symbols: share_quotes(client, symbols), risk_limits(args), multipliers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    submitted = datetime.datetime.now(datetime.timezone.utc)
+    results = place_plan(client, hashes, plan, args.quantity, prices, journal)
+
+    # Every account's orders come back from one account_orders_all call, so
+    # the whole batch is a single poll group. Dry runs have nothing to watch.
+    if args.wait_fills is not None and not args.dry_run:
+        # asyncio is only loaded when there are fills to wait for.
+        from fills import wait_for_fills
+        since = submitted - OrderReconciler.OVERLAP
+        wait_for_fills(
+            results,
+            lambda group, order_ids: order_statuses(client, since),
+            timeout=args.wait_fills,
+            group=lambda result: "all",
+        )
+    tracing.finish(args)
     # for account in accounts:
     #     account_num = account['accountNumber']
     #     hash_val = account['hashValue']
@@ -223,6 +610,7 @@ def main():
 
 
     ## Schwab-py
+    # from schwab import auth
     # c = auth.easy_client(app_key, app_secret, callback_url, token_path, interactive=False)
     # r = c.get_price_history_every_day('AAPL')
     # r.raise_for_status()
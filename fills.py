@@ -0,0 +1,129 @@
+from tracing import logger
+import asyncio
+import time
+
+
+# Fill monitor for a submitted batch. Orders are polled per group, one request
+# covering every order in the group: per account for Tradier, whose order list
+# is per account, and a single group for Schwab, whose account_orders_all
+# covers every linked account. Each group polls fast while its orders are new
+# and backs off as they age, so hundreds of resting orders cost a few requests
+# a minute instead of one per order per tick.
+#
+# The blocking broker calls run on worker threads under asyncio, at most
+# `concurrency` at once, and still pass through the brokers' rate limiters.
+
+
+FILLED = "filled"
+# Broker statuses (lowercased) after which an order can no longer fill.
+FINAL_STATUSES = ("filled", "canceled", "cancelled", "rejected", "expired", "error", "replaced")
+
+FAST_INTERVAL = 0.5
+MAX_INTERVAL = 15.0
+# Poll every quarter of the youngest pending order's age.
+AGE_FACTOR = 0.25
+DEFAULT_FILL_TIMEOUT = 120.0
+DEFAULT_POLL_CONCURRENCY = 4
+
+
+class TrackedOrder():
+    __slots__ = ("result", "status", "finished")
+
+    def __init__(self, result):
+        self.result = result
+        self.status = None
+        # Seconds from the start of monitoring to a final status.
+        self.finished = None
+
+    def pending(self):
+        return self.finished is None
+
+
+class FillMonitor():
+    # fetch(group, order_ids) returns {order_id: status} for the group's orders
+    # it found, and is called from worker threads. group(result) is the poll
+    # group of an OrderResult, its account by default.
+    def __init__(
+        self,
+        fetch,
+        group=None,
+        fast=FAST_INTERVAL,
+        max_interval=MAX_INTERVAL,
+        timeout=DEFAULT_FILL_TIMEOUT,
+        concurrency=DEFAULT_POLL_CONCURRENCY,
+    ):
+        self.fetch = fetch
+        self.group = group or (lambda result: result.account_id)
+        self.fast = fast
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.polls = 0
+
+    # Orders are only as old as the monitor, which starts right after the batch.
+    def interval(self, elapsed):
+        return min(self.max_interval, max(self.fast, elapsed * AGE_FACTOR))
+
+    async def watch_group(self, key, orders, start, semaphore):
+        deadline = start + self.timeout
+        by_id = {str(order.result.order_id): order for order in orders}
+        while True:
+            pending = [order_id for order_id, order in by_id.items() if order.pending()]
+            now = time.monotonic()
+            if not pending or now >= deadline:
+                return
+            await asyncio.sleep(min(self.interval(now - start), deadline - now))
+            async with semaphore:
+                try:
+                    statuses = await asyncio.to_thread(self.fetch, key, pending)
+                except Exception as e:
+                    logger.warning("Fill poll for {} failed: {}", key, e)
+                    continue
+                finally:
+                    self.polls += 1
+            elapsed = time.monotonic() - start
+            for order_id, status in statuses.items():
+                order = by_id.get(str(order_id))
+                if order is None or not order.pending():
+                    continue
+                order.status = status.lower()
+                if order.status in FINAL_STATUSES:
+                    order.finished = elapsed
+
+    async def watch(self, results):
+        groups = {}
+        for result in results:
+            groups.setdefault(self.group(result), []).append(TrackedOrder(result))
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+        start = time.monotonic()
+        await asyncio.gather(*(self.watch_group(key, orders, start, semaphore) for key, orders in groups.items()))
+        return [order for orders in groups.values() for order in orders]
+
+    def run(self, results):
+        return asyncio.run(self.watch(results))
+
+
+def report_fills(tracked, polls, elapsed):
+    for order in tracked:
+        result = order.result
+        if order.pending():
+            print(f"account={result.account_id} {result.side} {result.symbol} order={result.order_id} still {order.status or 'unknown'}")
+        else:
+            print(f"account={result.account_id} {result.side} {result.symbol} order={result.order_id} {order.status} after {order.finished:.1f}s")
+    filled = sum(1 for order in tracked if order.status == FILLED)
+    pending = sum(1 for order in tracked if order.pending())
+    print(f"Filled {filled}/{len(tracked)} orders, {pending} still open, {polls} status polls in {elapsed:.1f}s")
+
+
+# Wait for the placed orders among a batch's OrderResults to fill, up to
+# timeout seconds, then print a fill summary. Returns the TrackedOrders.
+def wait_for_fills(results, fetch, timeout=DEFAULT_FILL_TIMEOUT, group=None, concurrency=DEFAULT_POLL_CONCURRENCY):
+    placed = [result for result in results if result.order_id is not None and not result.skipped and not result.failed()]
+    if not placed:
+        return []
+    print(f"Waiting up to {timeout:g}s for {len(placed)} orders to fill")
+    monitor = FillMonitor(fetch, group=group, timeout=timeout, concurrency=concurrency)
+    start = time.monotonic()
+    tracked = monitor.run(placed)
+    report_fills(tracked, monitor.polls, time.monotonic() - start)
+    return tracked
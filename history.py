@@ -0,0 +1,164 @@
+from concurrent.futures import ThreadPoolExecutor
+from orders import BUY_LIMIT_MULTIPLIER
+import numpy as np
+import os
+import time
+
+
+# Local OHLCV price history, one directory per frequency and symbol with one
+# raw little-endian file per column:
+#
+#   <root>/daily/AAPL/time      int64 bar open, ms since the epoch
+#   <root>/daily/AAPL/open      float64, likewise high, low, close, volume
+#
+# Columns are append-only, so filling in new bars writes only the new rows, and
+# reads memory-map the files: bars() hands back views of the mapped pages
+# without copying or parsing anything. update() only asks the broker for bars
+# after the last stored one.
+#
+# Columns are appended one after another with time last; a crash between
+# them leaves some columns a row longer, and reads use the shortest length.
+# Daily bars are stamped at midnight UTC of their date whatever the broker
+# sends, so bars from either broker line up.
+
+
+DEFAULT_HISTORY_DIR = "./history"
+FREQUENCIES = ("daily", "minute")
+COLUMNS = (
+    ("open", np.float64),
+    ("high", np.float64),
+    ("low", np.float64),
+    ("close", np.float64),
+    ("volume", np.float64),
+    ("time", np.int64),
+)
+# How far back a symbol without any stored bars is filled from.
+BACKFILL_DAYS = {"daily": 365, "minute": 10}
+DAY_MS = 24 * 60 * 60 * 1000
+MINUTE_MS = 60 * 1000
+HISTORY_FETCH_CONCURRENCY = 4
+
+# Limit pad is VOLATILITY_MULTIPLE daily standard deviations through the last
+# price, kept within MIN_PAD/MAX_PAD; without enough history it falls back to
+# the fixed orders.BUY_LIMIT_MULTIPLIER pad.
+VOLATILITY_WINDOW = 20
+VOLATILITY_MULTIPLE = 2.0
+MIN_PAD = 0.02
+MAX_PAD = 0.15
+DEFAULT_PAD = BUY_LIMIT_MULTIPLIER - 1
+
+
+class PriceHistory():
+    def __init__(self, root=DEFAULT_HISTORY_DIR, frequency="daily"):
+        if frequency not in FREQUENCIES:
+            raise ValueError(f"Unknown frequency '{frequency}', expected one of {', '.join(FREQUENCIES)}")
+        self.root = root
+        self.frequency = frequency
+
+    def directory(self, symbol):
+        return os.path.join(self.root, self.frequency, symbol.upper())
+
+    def rows(self, symbol):
+        directory = self.directory(symbol)
+        sizes = []
+        for name, dtype in COLUMNS:
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                return 0
+            sizes.append(os.path.getsize(path) // np.dtype(dtype).itemsize)
+        return min(sizes)
+
+    # column name -> read only array over the stored bars, oldest first.
+    def bars(self, symbol):
+        count = self.rows(symbol)
+        directory = self.directory(symbol)
+        columns = {}
+        for name, dtype in COLUMNS:
+            if count == 0:
+                columns[name] = np.empty(0, dtype=dtype)
+            else:
+                columns[name] = np.memmap(os.path.join(directory, name), dtype=np.dtype(dtype).newbyteorder("<"), mode="r", shape=(count,))
+        return columns
+
+    def last_time(self, symbol):
+        times = self.bars(symbol)["time"]
+        return int(times[-1]) if len(times) else None
+
+    # Start (ms) of the bar still forming at now_ms: today's midnight UTC, or
+    # the current minute.
+    def open_bar(self, now_ms=None):
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        return now_ms - now_ms % (DAY_MS if self.frequency == "daily" else MINUTE_MS)
+
+    # Append candles ({"time", "open", ..., "volume"} dicts, oldest first),
+    # skipping any at or before the last stored bar and, with `before`, any
+    # from that time on. Returns how many were added.
+    def append(self, symbol, candles, before=None):
+        if self.frequency == "daily":
+            candles = [dict(candle, time=candle["time"] - candle["time"] % DAY_MS) for candle in candles]
+        last = self.last_time(symbol)
+        if last is not None:
+            candles = [candle for candle in candles if candle["time"] > last]
+        if before is not None:
+            candles = [candle for candle in candles if candle["time"] < before]
+        if not candles:
+            return 0
+        directory = self.directory(symbol)
+        os.makedirs(directory, exist_ok=True)
+        count = self.rows(symbol)
+        for name, dtype in COLUMNS:
+            column = np.array([candle[name] for candle in candles], dtype=np.dtype(dtype).newbyteorder("<"))
+            with open(os.path.join(directory, name), "r+b" if count else "wb") as f:
+                # Drop a partial row left by a crash before appending.
+                f.truncate(count * column.itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(column.tobytes())
+        return len(candles)
+
+    # Fill in every symbol's bars after its last stored one, or BACKFILL_DAYS
+    # of them for a new symbol. fetch(symbol, frequency, start_ms) returns the
+    # candles from start_ms on. The bar still forming is left out, since
+    # stored bars are never rewritten; the next update picks it up once it
+    # has closed. Returns symbol -> bars added.
+    def update(self, symbols, fetch, concurrency=HISTORY_FETCH_CONCURRENCY):
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        backfill = int((time.time() - BACKFILL_DAYS[self.frequency] * 24 * 60 * 60) * 1000)
+        forming = self.open_bar()
+
+        def fill(symbol):
+            last = self.last_time(symbol)
+            candles = fetch(symbol, self.frequency, backfill if last is None else last + 1)
+            return self.append(symbol, candles, before=forming)
+
+        if not symbols:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(symbols)))) as pool:
+            return dict(zip(symbols, pool.map(fill, symbols)))
+
+    # Standard deviation of the last `window` close to close log returns, or
+    # None with fewer bars than that.
+    def volatility(self, symbol, window=VOLATILITY_WINDOW):
+        close = self.bars(symbol)["close"][-(window + 1):]
+        if len(close) < window + 1 or np.any(close <= 0):
+            return None
+        return float(np.std(np.diff(np.log(close)), ddof=1))
+
+    # symbol -> (buy multiplier, sell multiplier) from each symbol's recent
+    # volatility, for orders.limit_prices.
+    def limit_multipliers(self, symbols, window=VOLATILITY_WINDOW):
+        multipliers = {}
+        for symbol in symbols:
+            volatility = self.volatility(symbol, window)
+            if volatility is None:
+                pad = DEFAULT_PAD
+            else:
+                pad = min(MAX_PAD, max(MIN_PAD, VOLATILITY_MULTIPLE * volatility))
+            multipliers[symbol] = (1 + pad, 1 - pad)
+        return multipliers
+
+
+# Bring the trades' symbols up to date and return their limit multipliers.
+def history_multipliers(history, trades, fetch):
+    symbols = [symbol for symbol, side in trades]
+    history.update(symbols, fetch)
+    return history.limit_multipliers(symbols)
@@ -0,0 +1,150 @@
+from batch import PlannedOrder
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+# Durable, append-only order journal. Every planned order is written as an
+# intent before anything is sent, each submission is written just before the
+# request goes out, and the outcome (with the broker's order id) as soon as the
+# response arrives. Each append is flushed and fsync'd, so after a crash or a
+# stopped batch the journal says exactly which orders are done.
+#
+# Re-running the same batch against the same journal resumes it: only orders
+# that were never sent or were rejected are placed again, straight from the
+# journal, without rescanning every account. Orders that were sent but have no
+# definite outcome (crash mid-request, timeout, 5xx) may have been placed, so
+# they are reported for checking instead of being sent twice.
+#
+# One JSON line per event, keyed by run/account/symbol/side:
+#   {"run": "...", "acct": "...", "sym": "PIXY", "side": "buy", "ev": "intent", "ts": 1700000000.0}
+#   ev is intent, sent, done (with "id"), rejected or unknown (with "code").
+
+
+INTENT = "intent"
+SENT = "sent"
+DONE = "done"
+REJECTED = "rejected"
+UNKNOWN = "unknown"
+
+
+# Same broker, trades, quantity and limit on the same day is the same run.
+def run_id(broker, trades, quantity, limit=None, day=None):
+    day = day or datetime.date.today().isoformat()
+    key = json.dumps([broker, list(trades), quantity, limit, day])
+    return f"{broker}-{day}-{hashlib.sha1(key.encode()).hexdigest()[:10]}"
+
+
+class OrderJournal():
+    def __init__(self, path, run):
+        self.path = path
+        self.run = run
+        self.lock = threading.Lock()
+        # (account, symbol, side) -> latest event, in intent order, and the
+        # broker order id of each order placed.
+        self.states = {}
+        self.order_ids = {}
+        self.load()
+        self.file = open(path, "a")
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-append.
+                    continue
+                if record.get("run") != self.run:
+                    continue
+                key = (record["acct"], record["sym"], record["side"])
+                self.states[key] = record["ev"]
+                if record.get("id") is not None:
+                    self.order_ids[key] = record["id"]
+
+    def close(self):
+        self.file.close()
+
+    def append(self, records):
+        lines = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+        with self.lock:
+            self.file.write(lines)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            for record in records:
+                key = (record["acct"], record["sym"], record["side"])
+                self.states[key] = record["ev"]
+                if record.get("id") is not None:
+                    self.order_ids[key] = record["id"]
+
+    def record(self, order, event, **fields):
+        record = {"run": self.run, "acct": order.account_id, "sym": order.symbol, "side": order.side, "ev": event, "ts": time.time()}
+        record.update(fields)
+        return record
+
+    # True once this run's plan has been journaled.
+    def planned(self):
+        return bool(self.states)
+
+    # Write every intent with a single fsync.
+    def plan(self, plan):
+        self.append([self.record(order, INTENT) for order in plan])
+
+    def sending(self, order):
+        self.append([self.record(order, SENT)])
+
+    # Outcome of a submitted order from its batch.OrderResult. A 4xx was
+    # rejected before anything happened; a 5xx or no response at all may still
+    # have placed the order.
+    def finished(self, result):
+        order = PlannedOrder(result.account_id, result.symbol, result.side)
+        if result.status_code is not None and result.status_code < 300:
+            self.append([self.record(order, DONE, id=result.order_id)])
+        elif result.status_code is not None and result.status_code < 500:
+            self.append([self.record(order, REJECTED, code=result.status_code)])
+        else:
+            self.append([self.record(order, UNKNOWN, code=result.status_code)])
+
+    # (orders still to place, orders whose outcome is unknown), both as
+    # PlannedOrders in the order they were planned.
+    def remaining(self):
+        todo = []
+        in_doubt = []
+        for (account, symbol, side), state in self.states.items():
+            order = PlannedOrder(account, symbol, side)
+            if state in (INTENT, REJECTED):
+                todo.append(order)
+            elif state in (SENT, UNKNOWN):
+                in_doubt.append(order)
+        return todo, in_doubt
+
+
+# The journal for a CLI run from add_journal_arguments' arguments, or None.
+# Dry runs and replays journal under their own run id so their synthetic
+# successes never mark real orders as done.
+def open_journal(args, broker, trades):
+    if args.journal is None:
+        return None
+    run = args.run or run_id(broker, trades, args.quantity, args.limit)
+    if args.dry_run or args.replay is not None:
+        run = f"{run}-dry-run"
+    return OrderJournal(args.journal, run)
+
+
+# Resume the run if the journal has it, otherwise scan accounts and journal a
+# new plan. build is called only for a new run and returns the full plan.
+def journaled_plan(journal, build):
+    if not journal.planned():
+        plan = build()
+        journal.plan(plan)
+        return plan
+    plan, in_doubt = journal.remaining()
+    print(f"Resuming run {journal.run}: {len(plan)} orders left")
+    for order in in_doubt:
+        print(f"account={order.account_id} {order.side} {order.symbol} was sent without a confirmed outcome, check it at the broker")
+    return plan
@@ -1,10 +1,11 @@
 import os
-import base64
 import requests
 import webbrowser
 from dotenv import load_dotenv
 from loguru import logger
 
+from token_store import DEFAULT_TOKEN_PATH, TokenStore, basic_auth_headers
+
 
 def construct_init_auth_url(app_key) -> str:
     # app_key = "your-app-key"
@@ -21,15 +22,7 @@ def construct_init_auth_url(app_key) -> str:
 def construct_headers_and_payload(returned_url, app_key, app_secret):
     response_code = f"{returned_url[returned_url.index('code=') + 5: returned_url.index('%40')]}@"
 
-    credentials = f"{app_key}:{app_secret}"
-    base64_credentials = base64.b64encode(credentials.encode("utf-8")).decode(
-        "utf-8"
-    )
-
-    headers = {
-        "Authorization": f"Basic {base64_credentials}",
-        "Content-Type": "application/x-www-form-urlencoded",
-    }
+    headers = basic_auth_headers(app_key, app_secret)
 
     payload = {
         "grant_type": "authorization_code",
@@ -52,11 +45,9 @@ def retrieve_tokens(headers, payload) -> dict:
     return init_tokens_dict
 
 
-def main():
-    load_dotenv()
-    app_key = os.getenv('ACCESS_KEY')
-    app_secret = os.getenv('SECRET_KEY')
-
+# Full browser based authorization code exchange. Only needed when there are no
+# stored tokens or the refresh token has expired.
+def authorize(app_key, app_secret) -> dict:
     cs_auth_url = construct_init_auth_url(app_key=app_key)
     webbrowser.open(cs_auth_url)
 
@@ -73,6 +64,35 @@ def main():
 
     logger.debug(init_tokens_dict)
 
+    return init_tokens_dict
+
+
+# Returns a TokenStore holding a valid access token, reusing the tokens saved by
+# a previous run when possible.
+def load_tokens(app_key, app_secret, path=DEFAULT_TOKEN_PATH) -> TokenStore:
+    store = TokenStore(app_key, app_secret, path=path)
+    try:
+        fresh = store.ensure_fresh()
+    except requests.RequestException as e:
+        # The refresh token was revoked or replaced before it expired.
+        logger.warning("Refreshing stored tokens failed, logging in again: {}", e)
+        fresh = False
+    if fresh:
+        logger.info("Reusing stored tokens from {}", path)
+    else:
+        store.update(authorize(app_key, app_secret))
+    return store
+
+
+def main():
+    load_dotenv()
+    app_key = os.getenv('ACCESS_KEY')
+    app_secret = os.getenv('SECRET_KEY')
+    token_path = os.getenv('SCHWAB_TOKEN_PATH', DEFAULT_TOKEN_PATH)
+
+    # Long running callers should also store.start() to keep the access token fresh.
+    load_tokens(app_key, app_secret, path=token_path)
+
     return "Done!"
 
 
@@ -0,0 +1,241 @@
+from risk import review_plan
+from typing import Optional
+from urllib.parse import urlencode
+import json
+
+
+# Order payload templates. The invariant parts of each broker's order are built
+# and encoded once per template; rendering an order only stamps in the symbol,
+# side, quantity and price, and encodes the result exactly once to bytes that
+# are used for both logging and the request body.
+
+
+BUY_LIMIT_MULTIPLIER = 1.1
+SELL_LIMIT_MULTIPLIER = 0.9
+
+def buying_limit(current_val, multiplier=BUY_LIMIT_MULTIPLIER):
+    limit = current_val * multiplier
+    limit = round(limit, 2)
+    return limit
+
+def selling_limit(current_val, multiplier=SELL_LIMIT_MULTIPLIER):
+    limit = current_val * multiplier
+    limit = round(limit, 2)
+    return limit
+
+
+# multipliers is a (buy, sell) pair, the fixed multipliers if None.
+def limit_price(side, current_val, multipliers=None):
+    buy, sell = multipliers or (BUY_LIMIT_MULTIPLIER, SELL_LIMIT_MULTIPLIER)
+    if side == "buy":
+        return buying_limit(current_val, buy)
+    return selling_limit(current_val, sell)
+
+
+# symbol -> limit price for the requested trades, or {} for market orders.
+# limit is None (market), "auto" (buying_limit/selling_limit of the last price
+# from quotes(symbols)) or a fixed price applied to every symbol. multipliers
+# maps symbol -> (buy, sell) multipliers for "auto", see history.PriceHistory.
+def limit_prices(trades, limit, quotes, multipliers=None):
+    if limit is None:
+        return {}
+    if limit != "auto":
+        price = float(limit)
+        return {symbol: price for symbol, side in trades}
+    found = quotes([symbol for symbol, side in trades])
+    prices = {}
+    for symbol, side in trades:
+        quote = found.get(symbol)
+        if quote is None or quote["last"] is None:
+            raise ValueError(f"No quote for {symbol}, cannot set a limit price")
+        prices[symbol] = limit_price(side, quote["last"], (multipliers or {}).get(symbol))
+    return prices
+
+
+# Limit prices and the risk checked plan from a single quote fetch. quotes is
+# only called when --limit auto or the risk check needs prices; risk is a
+# risk.RiskLimits, or None to skip the check.
+def priced_plan(plan, trades, quantity, limit, quotes, risk=None, multipliers=None):
+    needed = limit == "auto" or risk is not None
+    table = quotes([symbol for symbol, side in trades]) if needed else {}
+    prices = limit_prices(trades, limit, lambda symbols: table, multipliers)
+    if risk is not None:
+        plan = review_plan(plan, table, quantity, prices, risk)
+    return plan, prices
+
+
+# Sub-dollar prices may carry 4 decimals, anything else 2.
+def format_price(price):
+    return f"{price:.4f}" if price < 1 else f"{price:.2f}"
+
+
+class OrderPayload():
+    __slots__ = ("body", "content_type", "build", "_order")
+
+    def __init__(self, body, content_type, build=None):
+        self.body = body
+        self.content_type = content_type
+        self.build = build
+        self._order = None
+
+    # The object form, only built for clients that insist on encoding it themselves.
+    @property
+    def order(self):
+        if self._order is None and self.build is not None:
+            self._order = self.build()
+        return self._order
+
+    def __str__(self):
+        return self.body.decode()
+
+
+def design_order(
+    symbol,
+    order_type,
+    instruction,
+    quantity,
+    leg_id,
+    order_leg_type,
+    asset_type,
+    price: Optional[str] = None,
+    session="NORMAL",
+    duration="DAY",
+    complex_order_strategy_type="NONE",
+    tax_lot_method="FIFO",
+    position_effect="OPENING",
+    # special_instruction="ALL_OR_NONE",
+    order_strategy_type="SINGLE",
+):
+    post_order_payload = {
+        "price": price,
+        "session": session,
+        "duration": duration,
+        "orderType": order_type,
+        "complexOrderStrategyType": complex_order_strategy_type,
+        "quantity": quantity,
+        "taxLotMethod": tax_lot_method,
+        "orderLegCollection": [
+            {
+                "orderLegType": order_leg_type,
+                "legId": leg_id,
+                "instrument": {
+                    "symbol": symbol,
+                    "assetType": asset_type,
+                },
+                "instruction": instruction,
+                "positionEffect": position_effect,
+                "quantity": quantity,
+            }
+        ],
+        "orderStrategyType": order_strategy_type,
+    }
+
+    return post_order_payload
+
+
+# Placeholders stamped into the template skeleton; their JSON encodings are the
+# split points between the precompiled fragments.
+_STAMPS = ("price", "quantity", "symbol", "instruction", "leg_quantity")
+
+
+class SchwabOrderTemplate():
+    def __init__(self, order_type="MARKET", **kwargs):
+        self.order_type = order_type
+        skeleton = design_order(
+            symbol=_placeholder("symbol"),
+            order_type=order_type,
+            instruction=_placeholder("instruction"),
+            quantity=_placeholder("quantity"),
+            leg_id="1",
+            order_leg_type="EQUITY",
+            asset_type="EQUITY",
+            price=_placeholder("price"),
+            **kwargs,
+        )
+        skeleton["orderLegCollection"][0]["quantity"] = _placeholder("leg_quantity")
+        self.skeleton = skeleton
+
+        # Split the encoded skeleton at each placeholder, in document order.
+        text = json.dumps(skeleton)
+        positions = sorted((text.index(json.dumps(_placeholder(name))), name) for name in _STAMPS)
+        self.fragments = []
+        self.order_of_stamps = []
+        start = 0
+        for index, name in positions:
+            self.fragments.append(text[start:index])
+            self.order_of_stamps.append(name)
+            start = index + len(json.dumps(_placeholder(name)))
+        self.fragments.append(text[start:])
+
+    def render(self, symbol, instruction, quantity, price=None):
+        quantity = f"{quantity}"
+        price = None if price is None else format_price(price)
+        values = {
+            "price": price,
+            "quantity": quantity,
+            "symbol": symbol,
+            "instruction": instruction,
+            "leg_quantity": quantity,
+        }
+        parts = [self.fragments[0]]
+        for name, fragment in zip(self.order_of_stamps, self.fragments[1:]):
+            value = values[name]
+            parts.append("null" if value is None else _encode_string(value))
+            parts.append(fragment)
+        body = "".join(parts).encode()
+        return OrderPayload(body, "application/json", lambda: self.build(values))
+
+    def build(self, values):
+        leg = dict(self.skeleton["orderLegCollection"][0])
+        leg["instrument"] = {"symbol": values["symbol"], "assetType": leg["instrument"]["assetType"]}
+        leg["instruction"] = values["instruction"]
+        leg["quantity"] = values["leg_quantity"]
+        order = dict(self.skeleton)
+        order["price"] = values["price"]
+        order["quantity"] = values["quantity"]
+        order["orderLegCollection"] = [leg]
+        return order
+
+
+# Same escaping json.dumps applies to a str, without the per-call encoder setup.
+_encode_string = json.encoder.encode_basestring_ascii
+
+
+def _placeholder(name):
+    return f"\x00{name}\x00"
+
+
+# class - The kind of order to be placed. One of: equity, option, multileg, combo.
+# symbol - The symbol to be ordered.
+# duration - The time for which the order will be remain in effect (Day or GTC).
+# side - The side of the order (buy or sell).
+# quantity - The number of shares to be ordered, in whole numbers.
+# type - The type of order to be placed (market, limit, etc.)
+# price - The limit price, only for limit orders.
+class TradierOrderTemplate():
+    def __init__(self, order_type="market", duration="day", order_class="equity"):
+        self.order_type = order_type
+        self.prefix = urlencode({"class": order_class, "duration": duration, "type": order_type})
+
+    def render(self, symbol, side, quantity, price=None):
+        stamped = {"symbol": symbol, "side": side, "quantity": quantity}
+        if price is not None:
+            stamped["price"] = format_price(price)
+        body = f"{self.prefix}&{urlencode(stamped)}".encode()
+        return OrderPayload(body, "application/x-www-form-urlencoded")
+
+
+SCHWAB_MARKET = SchwabOrderTemplate("MARKET")
+SCHWAB_LIMIT = SchwabOrderTemplate("LIMIT")
+TRADIER_MARKET = TradierOrderTemplate("market")
+TRADIER_LIMIT = TradierOrderTemplate("limit")
+
+
+def schwab_order(symbol, instruction, quantity, price=None):
+    template = SCHWAB_MARKET if price is None else SCHWAB_LIMIT
+    return template.render(symbol, instruction, quantity, price)
+
+
+def tradier_order(symbol, side, quantity, price=None):
+    template = TRADIER_MARKET if price is None else TRADIER_LIMIT
+    return template.render(symbol, side, quantity, price)
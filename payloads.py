@@ -0,0 +1,95 @@
+import json
+
+
+# Field-selective parsing of account position payloads. The account scan only
+# needs account number, symbol and quantity, so those are read straight from
+# the response bytes into compact Holding records and the rest of the document
+# is dropped as soon as it is parsed; nothing is re-serialized.
+#
+# Backends are optional and picked on first use:
+#   - orjson, if installed, parses bytes faster than the json module.
+#   - ijson (with its yajl2_c backend) streams bodies of STREAM_THRESHOLD bytes
+#     or more one account at a time, so a large Schwab account_details_all
+#     never materializes as a whole. It is slower per byte than orjson but
+#     peaks at about a tenth of the memory.
+
+
+STREAM_THRESHOLD = 4 << 20
+
+
+class Holding():
+    __slots__ = ("account_id", "symbol", "quantity")
+
+    def __init__(self, account_id, symbol, quantity):
+        self.account_id = account_id
+        self.symbol = symbol
+        self.quantity = quantity
+
+    def __repr__(self):
+        return f"Holding({self.account_id!r}, {self.symbol!r}, {self.quantity!r})"
+
+
+_loads = None
+_ijson = False
+
+
+def loads(body):
+    global _loads
+    if _loads is None:
+        try:
+            import orjson
+            _loads = orjson.loads
+        except ImportError:
+            _loads = json.loads
+    return _loads(body)
+
+
+# ijson, when it has a C backend; the pure Python one is slower than parsing
+# the whole document.
+def streaming():
+    global _ijson
+    if _ijson is False:
+        try:
+            import ijson
+            _ijson = ijson if ijson.backend == "yajl2_c" else None
+        except ImportError:
+            _ijson = None
+    return _ijson
+
+
+# Parsed body of a requests.Response, from its bytes. Skips Response.json()'s
+# text decoding and charset detection.
+def response_json(response):
+    return loads(response.content)
+
+
+# Schwab account_details_all(fields='positions') body -> (account numbers,
+# Holdings). Accounts without positions are still listed.
+def schwab_holdings(body):
+    ijson = streaming() if len(body) >= STREAM_THRESHOLD else None
+    if ijson is not None:
+        accounts = ijson.items(body, "item.securitiesAccount", use_float=True)
+    else:
+        accounts = (entry["securitiesAccount"] for entry in loads(body))
+
+    account_ids = []
+    holdings = []
+    for account in accounts:
+        account_id = str(account["accountNumber"])
+        account_ids.append(account_id)
+        for position in account.get("positions") or ():
+            holdings.append(Holding(account_id, position["instrument"]["symbol"], position.get("longQuantity", 0)))
+    return account_ids, holdings
+
+
+# Tradier GET /v1/accounts/{id}/positions body -> Holdings. "position" is a
+# list, a single object for one position, and "positions" is the string "null"
+# for none.
+def tradier_holdings(account_id, body):
+    positions = loads(body).get("positions")
+    if not isinstance(positions, dict):
+        return []
+    found = positions.get("position") or ()
+    if isinstance(found, dict):
+        found = (found,)
+    return [Holding(account_id, position["symbol"], position["quantity"]) for position in found]
@@ -0,0 +1,98 @@
+# Shared index of held positions and open orders across many accounts, used by
+# both brokers' InProgress. Every check the order planner makes is a dict/set
+# lookup, so building an accounts x symbols plan never scans position lists.
+
+
+# Map broker specific order sides/instructions onto "buy" or "sell".
+def normalize_side(side):
+    side = side.lower()
+    if side.startswith("buy"):
+        return "buy"
+    if side.startswith("sell"):
+        return "sell"
+    raise ValueError(f"Unknown order side: {side}")
+
+
+class PositionIndex():
+    def __init__(self):
+        # account -> set of held symbols
+        self.symbols_by_account = {}
+        # symbol -> set of accounts holding it
+        self.accounts_by_symbol = {}
+        # (account, symbol) -> held quantity, may be fractional
+        self.quantities = {}
+        # (account, symbol) -> set of sides with an open order
+        self.open_orders = {}
+
+    def add_account(self, account_id):
+        self.symbols_by_account.setdefault(account_id, set())
+
+    def add_position(self, account_id, symbol, quantity=1):
+        self.add_account(account_id)
+        self.symbols_by_account[account_id].add(symbol)
+        self.accounts_by_symbol.setdefault(symbol, set()).add(account_id)
+        key = (account_id, symbol)
+        self.quantities[key] = self.quantities.get(key, 0) + float(quantity)
+
+    # Drop quantity shares, or the whole position when quantity is None or at
+    # least what is held.
+    def remove_position(self, account_id, symbol, quantity=None):
+        key = (account_id, symbol)
+        if key not in self.quantities:
+            return
+        remaining = 0 if quantity is None else self.quantities[key] - float(quantity)
+        if remaining > 0:
+            self.quantities[key] = remaining
+            return
+        del self.quantities[key]
+        self.symbols_by_account[account_id].discard(symbol)
+        holders = self.accounts_by_symbol.get(symbol)
+        if holders is not None:
+            holders.discard(account_id)
+            if not holders:
+                del self.accounts_by_symbol[symbol]
+
+    def add_open_order(self, account_id, symbol, side):
+        self.add_account(account_id)
+        self.open_orders.setdefault((account_id, symbol), set()).add(normalize_side(side))
+
+    def remove_open_order(self, account_id, symbol, side):
+        sides = self.open_orders.get((account_id, symbol))
+        if sides is None:
+            return
+        sides.discard(normalize_side(side))
+        if not sides:
+            del self.open_orders[(account_id, symbol)]
+
+    def accounts(self):
+        return list(self.symbols_by_account)
+
+    def holds(self, account_id, symbol):
+        return symbol in self.symbols_by_account.get(account_id, ())
+
+    def symbols(self, account_id):
+        return self.symbols_by_account.get(account_id, set())
+
+    def accounts_holding(self, symbol):
+        return self.accounts_by_symbol.get(symbol, set())
+
+    def quantity(self, account_id, symbol):
+        return self.quantities.get((account_id, symbol), 0)
+
+    def is_fractional(self, account_id, symbol):
+        quantity = self.quantity(account_id, symbol)
+        return quantity != int(quantity)
+
+    def has_open_order(self, account_id, symbol, side=None):
+        sides = self.open_orders.get((account_id, symbol))
+        if not sides:
+            return False
+        return side is None or normalize_side(side) in sides
+
+    # Buy only if not already owned and no buy order is already pending.
+    def should_buy(self, account_id, symbol):
+        return not self.holds(account_id, symbol) and not self.has_open_order(account_id, symbol, "buy")
+
+    # Sell only if owned and no sell order is already pending.
+    def should_sell(self, account_id, symbol):
+        return self.holds(account_id, symbol) and not self.has_open_order(account_id, symbol, "sell")
@@ -0,0 +1,132 @@
+from atomic import atomic_write_json
+from collections import OrderedDict
+import json
+import threading
+import time
+
+
+DEFAULT_TTL = 5.0
+DEFAULT_MAX_SIZE = 1024
+
+
+# In-process quote cache keyed by symbol, sitting in front of a batch fetcher.
+#
+# fetch(symbols) must return a dict of symbol -> quote (see tradier.share_quotes).
+# Quotes younger than `ttl` seconds are served from memory. With `stale_ttl` set,
+# quotes up to ttl + stale_ttl old are still served immediately while a background
+# thread refreshes them (stale-while-revalidate). Anything older is fetched inline.
+# The least recently used symbols are evicted past `max_size` entries.
+#
+# If `path` is given the cache is loaded from and saved to that JSON file, so
+# back to back CLI runs can share quotes. Entries are stamped with wall clock
+# time so their age survives across processes.
+class QuoteCache():
+    def __init__(self, fetch, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE, stale_ttl=0.0, path=None):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stale_ttl = stale_ttl
+        self.path = path
+        # symbol -> (fetched_at, quote), most recently used last.
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.refreshing = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        # Age (seconds) of quotes served from the cache, for tuning ttl.
+        self.age_total = 0.0
+        self.age_max = 0.0
+        if path is not None:
+            self.load()
+
+    def get(self, symbol):
+        return self.get_many([symbol]).get(symbol)
+
+    def get_many(self, symbols):
+        now = time.time()
+        found = {}
+        missing = []
+        stale = []
+        with self.lock:
+            for symbol in symbols:
+                entry = self.entries.get(symbol)
+                age = None if entry is None else now - entry[0]
+                if age is not None and age <= self.ttl:
+                    self.hits += 1
+                elif age is not None and age <= self.ttl + self.stale_ttl:
+                    self.stale_hits += 1
+                    if symbol not in self.refreshing:
+                        self.refreshing.add(symbol)
+                        stale.append(symbol)
+                else:
+                    self.misses += 1
+                    missing.append(symbol)
+                    continue
+                self.entries.move_to_end(symbol)
+                self.age_total += age
+                self.age_max = max(self.age_max, age)
+                found[symbol] = entry[1]
+
+        if stale:
+            thread = threading.Thread(target=self.revalidate, args=(stale,), daemon=True)
+            thread.start()
+        if missing:
+            fetched = self.fetch(missing)
+            self.store(fetched)
+            found.update(fetched)
+        return found
+
+    def revalidate(self, symbols):
+        try:
+            self.store(self.fetch(symbols))
+        finally:
+            with self.lock:
+                self.refreshing.difference_update(symbols)
+                self.refreshes += 1
+
+    def store(self, quotes, fetched_at=None):
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self.lock:
+            for symbol, quote in quotes.items():
+                self.entries[symbol] = (fetched_at, quote)
+                self.entries.move_to_end(symbol)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            served = self.hits + self.stale_hits
+            lookups = served + self.misses
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "hit_rate": served / lookups if lookups else 0.0,
+                "size": len(self.entries),
+                "age_avg": self.age_total / served if served else 0.0,
+                "age_max": self.age_max,
+            }
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        with self.lock:
+            for symbol, (fetched_at, quote) in saved.items():
+                self.entries[symbol] = (fetched_at, quote)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    # Written atomically, so a crash or a concurrent run never leaves a half
+    # written cache behind.
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            saved = {symbol: list(entry) for symbol, entry in self.entries.items()}
+        atomic_write_json(self.path, saved)
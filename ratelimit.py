@@ -0,0 +1,174 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+# Client side rate limiting shared by every call to a broker.
+#
+# Each endpoint class (trading, account, market data) gets its own token bucket,
+# and all classes also draw from one shared bucket for the broker's overall
+# limit. Waiters on a bucket are served strictly by priority, so when the shared
+# budget runs short order placement goes ahead of quote and position refreshes.
+# observe() feeds responses back: a 429 or an exhausted rate limit header pauses
+# the bucket until the broker says the window resets.
+
+
+TRADING = "trading"
+ACCOUNT = "account"
+MARKET = "market"
+
+# Lower runs first.
+PRIORITY_ORDER = 0
+PRIORITY_ACCOUNT = 1
+PRIORITY_MARKET = 2
+
+PRIORITIES = {
+    TRADING: PRIORITY_ORDER,
+    ACCOUNT: PRIORITY_ACCOUNT,
+    MARKET: PRIORITY_MARKET,
+}
+
+# 429s are waited out through the limiter rather than failing the batch, so
+# they get more attempts than other errors.
+RATE_LIMIT_RETRIES = 10
+
+# Default backoff (seconds) after a 429 that carries no reset information.
+DEFAULT_PENALTY = 1.0
+MAX_PENALTY = 60.0
+
+
+class TokenBucket():
+    def __init__(self, rate, capacity):
+        # rate is tokens per second, capacity the burst size.
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+        self.waiters = []
+        self.counter = itertools.count()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Block until a token is available and every higher priority (or earlier
+    # equal priority) waiter has been served.
+    def acquire(self, priority=PRIORITY_ACCOUNT):
+        entry = (priority, next(self.counter))
+        with self.condition:
+            heapq.heappush(self.waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.refill(now)
+                    if self.waiters[0] == entry and now >= self.paused_until and self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    self.condition.wait(self.wait_time(now) if self.waiters[0] == entry else None)
+            finally:
+                self.waiters.remove(entry)
+                heapq.heapify(self.waiters)
+                self.condition.notify_all()
+
+    def wait_time(self, now):
+        if now < self.paused_until:
+            return self.paused_until - now
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    # Stop handing out tokens for `seconds`, e.g. after a 429.
+    def pause(self, seconds):
+        with self.condition:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0
+            self.updated = now
+            self.condition.notify_all()
+
+    # The broker reported how many calls are left in the current window.
+    def clamp(self, available):
+        with self.condition:
+            self.refill(time.monotonic())
+            self.tokens = min(self.tokens, available)
+
+
+class RateLimiter():
+    # limits maps endpoint class -> (requests per minute, burst); overall is the
+    # shared (requests per minute, burst) across all classes, or None.
+    def __init__(self, limits, overall=None):
+        self.buckets = {name: TokenBucket(per_minute / 60, burst) for name, (per_minute, burst) in limits.items()}
+        self.overall = None if overall is None else TokenBucket(overall[0] / 60, overall[1])
+        self.penalties = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, endpoint_class, priority=None):
+        if priority is None:
+            priority = PRIORITIES.get(endpoint_class, PRIORITY_ACCOUNT)
+        bucket = self.buckets.get(endpoint_class)
+        if bucket is not None:
+            bucket.acquire(priority)
+        if self.overall is not None:
+            self.overall.acquire(priority)
+
+    # Adapt to the broker's view of our usage. Understands Retry-After and the
+    # X-Ratelimit-Available / X-Ratelimit-Expiry (epoch ms) headers Tradier sends.
+    def observe(self, endpoint_class, response):
+        bucket = self.buckets.get(endpoint_class) or self.overall
+        if bucket is None:
+            return
+        headers = response.headers
+        reset_in = _reset_in(headers)
+
+        if response.status_code == 429:
+            with self.lock:
+                # Double the penalty on back to back 429s when the broker gives no hint.
+                penalty = min(MAX_PENALTY, self.penalties.get(endpoint_class, DEFAULT_PENALTY / 2) * 2)
+                self.penalties[endpoint_class] = penalty
+            bucket.pause(reset_in if reset_in is not None else penalty)
+            return
+
+        with self.lock:
+            self.penalties.pop(endpoint_class, None)
+        available = headers.get('X-Ratelimit-Available')
+        if available is None:
+            return
+        try:
+            available = int(available)
+        except ValueError:
+            return
+        if available <= 0 and reset_in is not None:
+            bucket.pause(reset_in)
+        else:
+            bucket.clamp(available)
+
+
+def _reset_in(headers):
+    retry_after = headers.get('Retry-After')
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    expiry = headers.get('X-Ratelimit-Expiry')
+    if expiry is not None:
+        try:
+            return max(0.0, int(expiry) / 1000 - time.time())
+        except ValueError:
+            pass
+    return None
+
+
+# Tradier publishes per minute limits per endpoint group.
+def tradier_limiter():
+    return RateLimiter({
+        TRADING: (60, 10),
+        ACCOUNT: (120, 20),
+        MARKET: (120, 20),
+    })
+
+
+# Schwab's trader API allows 120 calls a minute per app across all endpoints.
+def schwab_limiter():
+    return RateLimiter({}, overall=(120, 20))
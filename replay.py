@@ -0,0 +1,346 @@
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import itertools
+import json
+import re
+import threading
+import time
+
+import requests
+
+
+# Record / replay / dry-run transports for both brokers.
+#
+# Recording writes one JSON line per broker call: which broker, a call key, the
+# status, headers, body and how long it took. Replaying serves those recorded
+# responses offline (optionally sleeping the recorded or a fixed latency), so
+# the whole snapshot -> plan -> submit pipeline runs deterministically without
+# a network. Order submission is never replayed to the broker: in dry-run and
+# replay modes orders are printed and answered with a synthetic success.
+#
+# Tradier is hooked in as a requests transport adapter on the pooled session.
+# schwabdev makes bare requests.get/post calls, so Schwab is wrapped at the
+# client method level instead (account_linked, order_place, ...).
+
+
+# Headers worth keeping for rate limiting and order ids.
+KEPT_HEADERS = ("Content-Type", "Location", "Retry-After", "X-Ratelimit-Available", "X-Ratelimit-Expiry")
+DRY_RUN_ORDER_ID = itertools.count(1)
+
+# Tradier account ids and Schwab account hashes inside paths, so a call recorded
+# for one account can stand in for any other when replaying at scale.
+ACCOUNT_SEGMENT = re.compile(r"(/v1/accounts/|/trader/v1/accounts/)[^/?]+")
+
+
+class Recorder():
+    def __init__(self, path):
+        self.file = open(path, "a")
+        self.lock = threading.Lock()
+
+    def write(self, broker, key, response, elapsed):
+        record = {
+            "broker": broker,
+            "key": key,
+            "status": response.status_code,
+            "headers": {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+            "body": response.text,
+            "elapsed": elapsed,
+        }
+        line = json.dumps(record)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# Recorded responses by key. Repeated calls with the same key are answered in
+# recorded order, the last one repeating once they run out.
+class Recording():
+    def __init__(self, records):
+        self.responses = {}
+        self.lock = threading.Lock()
+        for record in records:
+            self.responses.setdefault((record["broker"], record["key"]), []).append(record)
+            generic = (record["broker"], generic_key(record["key"]))
+            self.responses.setdefault(generic, []).append(record)
+        self.positions = {}
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls([json.loads(line) for line in f if line.strip()])
+
+    def find(self, broker, key):
+        for lookup in ((broker, key), (broker, generic_key(key))):
+            records = self.responses.get(lookup)
+            if records:
+                with self.lock:
+                    index = self.positions.get(lookup, 0)
+                    self.positions[lookup] = index + 1
+                return records[min(index, len(records) - 1)]
+        return None
+
+
+def generic_key(key):
+    return ACCOUNT_SEGMENT.sub(r"\1{account}", key)
+
+
+def build_response(status, body, headers=None, url=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = body.encode() if isinstance(body, str) else body
+    response.headers = CaseInsensitiveDict(headers or {})
+    response.encoding = "utf-8"
+    response.url = url
+    return response
+
+
+# Sleep before answering a replayed call. latency is "recorded" (the recorded
+# elapsed time times scale), a fixed number of seconds, or None for no delay.
+def inject_latency(latency, record, scale=1.0):
+    if latency is None:
+        return
+    if latency == "recorded":
+        time.sleep(record["elapsed"] * scale)
+    else:
+        time.sleep(float(latency))
+
+
+def dry_run_order(broker, description):
+    order_id = next(DRY_RUN_ORDER_ID)
+    print(f"[dry run] {broker} order not submitted: {description}")
+    if broker == "tradier":
+        return build_response(200, json.dumps({"order": {"id": order_id, "status": "ok", "dry_run": True}}))
+    return build_response(201, "", {"Location": f"/trader/v1/accounts/dry-run/orders/{order_id}"})
+
+
+## Tradier
+
+
+def tradier_key(request):
+    url = urlsplit(request.url)
+    query = urlencode(sorted(parse_qsl(url.query)))
+    key = f"{request.method} {url.path}"
+    return f"{key}?{query}" if query else key
+
+
+def is_order_submission(request):
+    return request.method == "POST" and urlsplit(request.url).path.endswith("/orders")
+
+
+class RecordingAdapter(HTTPAdapter):
+    def __init__(self, recorder, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        response = super().send(request, **kwargs)
+        # Read the body now so the recorded elapsed time covers it.
+        response.content
+        self.recorder.write("tradier", tradier_key(request), response, time.perf_counter() - start)
+        return response
+
+
+class DryRunAdapter(HTTPAdapter):
+    def send(self, request, **kwargs):
+        if is_order_submission(request):
+            body = request.body.decode() if isinstance(request.body, bytes) else request.body
+            return self.answer(request, dry_run_order("tradier", f"{urlsplit(request.url).path} {body}"))
+        return super().send(request, **kwargs)
+
+    def answer(self, request, response):
+        response.request = request
+        response.url = request.url
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    def __init__(self, recording, latency=None, scale=1.0):
+        super().__init__()
+        self.recording = recording
+        self.latency = latency
+        self.scale = scale
+
+    def send(self, request, **kwargs):
+        if is_order_submission(request):
+            body = request.body.decode() if isinstance(request.body, bytes) else request.body
+            response = dry_run_order("tradier", f"{urlsplit(request.url).path} {body}")
+        else:
+            key = tradier_key(request)
+            record = self.recording.find("tradier", key)
+            if record is None:
+                raise requests.ConnectionError(f"No recorded response for {key}")
+            inject_latency(self.latency, record, self.scale)
+            response = build_response(record["status"], record["body"], record["headers"])
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+## Schwab
+
+
+# Proxy around a schwabdev.Client (or a ReplayClient) that records, dry-runs or
+# both. Only the calls charles.py makes need to be listed.
+class SchwabTransport():
+    CALLS = ("account_linked", "account_details_all", "account_orders_all", "account_orders", "quotes", "order_place", "price_history")
+
+    def __init__(self, client, recorder=None, dry_run=False):
+        self.client = client
+        self.recorder = recorder
+        self.dry_run = dry_run
+
+    def __getattr__(self, name):
+        call = getattr(self.client, name)
+        if name not in self.CALLS:
+            return call
+
+        def wrapped(*args, **kwargs):
+            if name == "order_place" and self.dry_run:
+                return dry_run_order("schwab", json.dumps(kwargs.get("order", args[-1] if args else None)))
+            start = time.perf_counter()
+            response = call(*args, **kwargs)
+            if self.recorder is not None:
+                self.recorder.write("schwab", schwab_key(name, args, kwargs), response, time.perf_counter() - start)
+            return response
+        wrapped.__name__ = name
+        return wrapped
+
+
+def schwab_key(name, args, kwargs):
+    # Keep the key stable across runs: account hashes and symbols yes, time windows no.
+    parts = []
+    for arg in args:
+        if isinstance(arg, (str, int)):
+            parts.append(str(arg))
+        elif isinstance(arg, (list, tuple)):
+            # quotes([...]) and friends; sorted so the order asked in does not matter.
+            parts.append(",".join(sorted(str(item) for item in arg)))
+    parts += [f"{key}={value}" for key, value in sorted(kwargs.items()) if key not in ("order", "fromEnteredTime", "toEnteredTime")]
+    if name == "order_place" and parts:
+        parts = [f"/trader/v1/accounts/{parts[0]}"] + parts[1:]
+    return " ".join([name] + parts)
+
+
+# Offline stand-in for schwabdev.Client that answers from a recording.
+class ReplayClient():
+    def __init__(self, recording, latency=None, scale=1.0):
+        self.recording = recording
+        self.latency = latency
+        self.scale = scale
+
+    def __getattr__(self, name):
+        def replayed(*args, **kwargs):
+            if name == "order_place":
+                return dry_run_order("schwab", json.dumps(kwargs.get("order")))
+            key = schwab_key(name, args, kwargs)
+            record = self.recording.find("schwab", key)
+            if record is None:
+                raise requests.ConnectionError(f"No recorded response for {key}")
+            inject_latency(self.latency, record, self.scale)
+            return build_response(record["status"], record["body"], record["headers"])
+        replayed.__name__ = name
+        return replayed
+
+
+## Scaling
+
+
+# Rewrite the recorded account lists to hold `accounts` synthetic copies of the
+# first recorded account. Per-account calls of the other real accounts are
+# dropped, so every synthetic account is answered through the generic key with
+# the first account's recorded responses. Lets a recording from a handful of
+# accounts drive a 10 / 100 / 1000 account replay.
+def scale_accounts(records, accounts):
+    templates = set()
+    for record in records:
+        if record["broker"] == "tradier" and record["key"] == "GET /v1/user/profile":
+            template = json.loads(record["body"])["profile"]["account"]
+            template = template[0] if isinstance(template, list) else template
+            templates.add(("tradier", str(template["account_number"])))
+        elif record["broker"] == "schwab" and record["key"] == "account_linked":
+            templates.add(("schwab", json.loads(record["body"])[0]["hashValue"]))
+
+    scaled = []
+    for record in records:
+        match = ACCOUNT_SEGMENT.search(record["key"])
+        if match is not None and (record["broker"], match.group(0)[len(match.group(1)):]) not in templates:
+            continue
+        record = dict(record)
+        if record["broker"] == "tradier" and record["key"] == "GET /v1/user/profile":
+            data = json.loads(record["body"])
+            template = data["profile"]["account"]
+            template = template[0] if isinstance(template, list) else template
+            data["profile"]["account"] = [dict(template, account_number=f"SIM{i:05d}") for i in range(accounts)]
+            record["body"] = json.dumps(data)
+        elif record["broker"] == "schwab" and record["key"] == "account_linked":
+            template = json.loads(record["body"])[0]
+            linked = [dict(template, accountNumber=f"SIM{i:05d}", hashValue=f"SIMHASH{i:05d}") for i in range(accounts)]
+            record["body"] = json.dumps(linked)
+        elif record["broker"] == "schwab" and record["key"].startswith("account_details_all"):
+            details = json.loads(record["body"])
+            template = details[0] if details else {"securitiesAccount": {}}
+            scaled_details = []
+            for i in range(accounts):
+                account = json.loads(json.dumps(template))
+                account["securitiesAccount"]["accountNumber"] = f"SIM{i:05d}"
+                scaled_details.append(account)
+            record["body"] = json.dumps(scaled_details)
+        scaled.append(record)
+    return scaled
+
+
+## CLI wiring
+
+
+def load_recording(args):
+    with open(args.replay) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if args.replay_accounts is not None:
+        records = scale_accounts(records, args.replay_accounts)
+    return Recording(records)
+
+
+# Mount the transport the arguments ask for on a TradierClient's session.
+# Replays run without the client side rate limiter: nothing reaches the broker,
+# and --replay-latency is the knob for realistic timing.
+def install_tradier(client, args, recording=None):
+    if args.replay is not None:
+        adapter = ReplayAdapter(recording or load_recording(args), latency=args.replay_latency)
+        client.limiter = None
+    elif args.record is not None:
+        adapter = RecordingAdapter(Recorder(args.record))
+        if args.dry_run:
+            adapter = _DryRunRecordingAdapter(adapter.recorder)
+    elif args.dry_run:
+        adapter = DryRunAdapter()
+    else:
+        return
+    client.session.mount("https://", adapter)
+    client.session.mount("http://", adapter)
+
+
+class _DryRunRecordingAdapter(RecordingAdapter, DryRunAdapter):
+    def send(self, request, **kwargs):
+        if is_order_submission(request):
+            return DryRunAdapter.send(self, request, **kwargs)
+        return RecordingAdapter.send(self, request, **kwargs)
+
+
+# The Schwab client to use for the arguments given. make_client builds the real
+# schwabdev client and is not called at all when replaying.
+def schwab_client(make_client, args, recording=None):
+    if args.replay is not None:
+        return ReplayClient(recording or load_recording(args), latency=args.replay_latency)
+    recorder = Recorder(args.record) if args.record is not None else None
+    client = make_client()
+    if recorder is None and not args.dry_run:
+        return client
+    return SchwabTransport(client, recorder=recorder, dry_run=args.dry_run)
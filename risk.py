@@ -0,0 +1,159 @@
+import math
+
+
+# Pre-trade risk check over a whole order plan in one vectorized pass. Every
+# PlannedOrder becomes a row; prices come from one quote table for the plan's
+# symbols, so thousands of orders are checked in a few milliseconds with no
+# per-order quote calls. numpy is only imported once a plan is checked, so the
+# CLIs' --help stays fast.
+#
+# Warnings are printed but the order still goes out:
+#   - buying above max_buy_price or selling below min_sell_price
+#   - no quote for the symbol
+# Blocked orders are not sent:
+#   - a limit price more than limit_band away from the last price
+#   - buys past max_account_notional for the account, in plan order; once an
+#     account is over, its later buys are blocked too
+
+
+DEFAULT_MAX_BUY_PRICE = 1.0
+DEFAULT_MIN_SELL_PRICE = 1.0
+# Auto limits sit 10% through the last price; twice that is almost surely a typo.
+DEFAULT_LIMIT_BAND = 0.2
+
+
+class RiskLimits():
+    def __init__(
+        self,
+        max_buy_price=DEFAULT_MAX_BUY_PRICE,
+        min_sell_price=DEFAULT_MIN_SELL_PRICE,
+        limit_band=DEFAULT_LIMIT_BAND,
+        max_account_notional=None,
+    ):
+        self.max_buy_price = max_buy_price
+        self.min_sell_price = min_sell_price
+        self.limit_band = limit_band
+        self.max_account_notional = max_account_notional
+
+
+class RiskReport():
+    def __init__(self, plan, approved, warned, blocked, checks):
+        self.plan = plan
+        # Indexes into plan.
+        self.approved = approved
+        self.warned = warned
+        self.blocked = blocked
+        # (kind, mask over plan, reason) of every check run
+        self.checks = checks
+
+    # Why the order at plan index i was warned or blocked.
+    def reasons(self, i):
+        return [reason for kind, mask, reason in self.checks if mask[i]]
+
+    # Orders to send, approved and warned, in plan order.
+    def allowed(self):
+        blocked = set(self.blocked.tolist())
+        return [order for i, order in enumerate(self.plan) if i not in blocked]
+
+    def print(self):
+        for label, indexes in (("warning", self.warned), ("blocked", self.blocked)):
+            for i in indexes:
+                order = self.plan[i]
+                print(f"account={order.account_id} {order.side} {order.symbol} {label}: {', '.join(self.reasons(i))}")
+        print(f"Risk check: {len(self.approved)} approved, {len(self.warned)} warned, {len(self.blocked)} blocked")
+
+
+# quotes maps symbol -> {"last", ...} (tradier/charles share_quotes); prices
+# maps symbol -> limit price for limit orders.
+def check_plan(plan, quotes, quantity, prices=None, limits=None):
+    import numpy as np
+
+    limits = limits or RiskLimits()
+    prices = prices or {}
+    count = len(plan)
+    if count == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return RiskReport(plan, empty, empty, empty, [])
+
+    symbols, symbol_index = np.unique(np.array([order.symbol for order in plan]), return_inverse=True)
+    accounts, account_index = np.unique(np.array([str(order.account_id) for order in plan]), return_inverse=True)
+    buying = np.array([order.side == "buy" for order in plan])
+
+    # Per symbol tables, then one gather per order.
+    last_by_symbol = np.array([_last(quotes.get(symbol)) for symbol in symbols], dtype=float)
+    limit_by_symbol = np.array([prices.get(symbol, math.nan) for symbol in symbols], dtype=float)
+    last = last_by_symbol[symbol_index]
+    limit = limit_by_symbol[symbol_index]
+
+    checks = []
+    unquoted = np.isnan(last)
+    checks.append(("warn", unquoted, "no quote"))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        checks.append(("warn", buying & (last > limits.max_buy_price), f"buying above ${limits.max_buy_price:g}"))
+        checks.append(("warn", ~buying & (last < limits.min_sell_price), f"selling below ${limits.min_sell_price:g}"))
+        if limits.limit_band is not None:
+            off = np.abs(limit / last - 1) > limits.limit_band
+            checks.append(("block", off & ~np.isnan(limit), f"limit more than {limits.limit_band:.0%} from last price"))
+
+    if limits.max_account_notional is not None:
+        # Running total of buy notional per account in plan order: stable sort
+        # by account, cumulative sum, minus each account's starting offset.
+        # Buys already blocked above are not counted. The buy that takes an
+        # account past the cap still counts, so every later buy in that
+        # account is blocked even if it alone would fit: plan order is the
+        # priority, and the account's buys stop at the first one over.
+        already = np.zeros(count, dtype=bool)
+        for kind, mask, reason in checks:
+            if kind == "block":
+                already |= mask
+        notional = np.where(np.isnan(limit), last, limit) * quantity
+        notional = np.where(buying & ~already & ~np.isnan(notional), notional, 0.0)
+        order = np.argsort(account_index, kind="stable")
+        running = np.cumsum(notional[order])
+        starts = np.searchsorted(account_index[order], np.arange(len(accounts)))
+        offsets = np.concatenate(([0.0], running))[starts]
+        cumulative = np.empty(count)
+        cumulative[order] = running - offsets[account_index[order]]
+        over = buying & (cumulative > limits.max_account_notional)
+        checks.append(("block", over, f"account buys over ${limits.max_account_notional:g}"))
+
+    warned = np.zeros(count, dtype=bool)
+    blocked = np.zeros(count, dtype=bool)
+    for kind, mask, reason in checks:
+        if kind == "warn":
+            warned |= mask
+        else:
+            blocked |= mask
+
+    return RiskReport(
+        plan,
+        approved=np.flatnonzero(~warned & ~blocked),
+        warned=np.flatnonzero(warned & ~blocked),
+        blocked=np.flatnonzero(blocked),
+        checks=checks,
+    )
+
+
+def _last(quote):
+    if quote is None or quote.get("last") is None:
+        return math.nan
+    return float(quote["last"])
+
+
+# Check the plan, print what was warned and blocked, and return the orders to send.
+def review_plan(plan, quotes, quantity, prices=None, limits=None):
+    report = check_plan(plan, quotes, quantity, prices, limits)
+    report.print()
+    return report.allowed()
+
+
+# RiskLimits from add_risk_arguments' arguments, or None with --no-risk-check.
+def risk_limits(args):
+    if not args.risk_check:
+        return None
+    return RiskLimits(
+        max_buy_price=args.max_buy_price,
+        min_sell_price=args.min_sell_price,
+        limit_band=args.limit_band,
+        max_account_notional=args.max_account_notional,
+    )
@@ -0,0 +1,243 @@
+from batch import add_risk_arguments, build_plan, collect_trades
+from brokers import BROKERS, brokers_from_env, selected_brokers
+from dotenv import load_dotenv
+from flask import Flask, jsonify, request
+from orders import priced_plan
+from risk import risk_limits
+from tracing import TRACER, logger
+import argparse
+import os
+import threading
+import time
+import tracing
+
+
+# Long running order service. Broker clients, pooled connections, tokens and
+# the positions index are loaded once at startup and kept warm, so a trade
+# submitted over the local HTTP API costs only the order round trip itself.
+#
+#   POST /orders   {"broker": "tradier", "trades": [{"symbol": "PIXY", "side": "buy"}], "quantity": 1}
+#                  {"broker": "schwab", "symbols": ["PIXY", "MULN"], "side": "sell", "limit": "auto"}
+#   POST /refresh  {"broker": "tradier"}  reload positions and open orders
+#   GET  /latency  broker call latency histograms by endpoint and account
+#   GET  /health
+
+
+DEFAULT_PORT = 5005
+# Positions go stale as orders fill; reload them in the background this often (seconds).
+DEFAULT_REFRESH_INTERVAL = 300
+# Between reloads, pull just the order status changes this often (seconds).
+DEFAULT_RECONCILE_INTERVAL = 30
+
+
+# Keeps one Broker's accounts and positions index warm between requests.
+class BrokerService():
+    # risk is a risk.RiskLimits for the pre-trade check, or None to skip it.
+    def __init__(self, broker, risk=None):
+        self.broker = broker
+        self.name = broker.name
+        self.risk = risk
+        # Serialises plan building and index updates; order submission itself
+        # happens outside the lock.
+        self.lock = threading.Lock()
+        self.account_ids = ()
+        self.progress = None
+        # (account_id, symbol, side) -> number of requests still placing it,
+        # and -> time.monotonic() it was placed. A snapshot can miss both, so
+        # refresh() marks them pending again on the new index.
+        self.in_flight = {}
+        self.placed = {}
+        self.refresh()
+
+    def refresh(self):
+        started = time.monotonic()
+        account_ids, progress = self.broker.snapshot()
+        with self.lock:
+            self.account_ids = account_ids
+            self.progress = progress
+            # Orders placed before the snapshot started are in it.
+            self.placed = {key: at for key, at in self.placed.items() if at >= started}
+            for key in list(self.in_flight) + list(self.placed):
+                self.progress.add_open_order(*key)
+
+    def execute(self, trades, quantity, limit=None):
+        with self.lock:
+            plan = build_plan(self.account_ids, trades, self.progress)
+            # Record the orders as pending in the same locked section that
+            # planned them, so an overlapping request for the same symbols
+            # does not plan them a second time.
+            keys = [(order.account_id, order.symbol, order.side) for order in plan]
+            for key in keys:
+                self.in_flight[key] = self.in_flight.get(key, 0) + 1
+                self.progress.add_open_order(*key)
+        results = []
+        try:
+            # Quotes and the risk check happen outside the lock; orders it
+            # blocks are released again below with everything not placed.
+            plan, prices = priced_plan(plan, trades, quantity, limit, self.broker.quotes, self.risk)
+            results = self.broker.place_plan(plan, quantity, prices)
+        finally:
+            placed = {(result.account_id, result.symbol, result.side) for result in results if not result.skipped and not result.failed()}
+            now = time.monotonic()
+            with self.lock:
+                for key in keys:
+                    self.in_flight[key] -= 1
+                    if not self.in_flight[key]:
+                        del self.in_flight[key]
+                    if key in placed:
+                        self.placed[key] = now
+                    elif key not in self.in_flight and key not in self.placed:
+                        # Blocked, skipped, failed or never reached because
+                        # pricing or place_plan raised.
+                        self.progress.remove_open_order(*key)
+        return results
+
+    # Apply order status changes since the last poll, for brokers that can.
+    def reconcile(self):
+        reconciler = self.broker.reconciler
+        if reconciler is None:
+            return 0
+        changes = reconciler.fetch()
+        with self.lock:
+            reconciler.apply(changes, self.progress)
+        return len(changes)
+
+
+def refresh_loop(services, interval, stopped):
+    while not stopped.wait(interval):
+        for service in services.values():
+            try:
+                service.refresh()
+            except Exception as e:
+                logger.error("{} refresh failed: {}", service.name, e)
+
+
+def reconcile_loop(services, interval, stopped):
+    while not stopped.wait(interval):
+        for service in services.values():
+            try:
+                service.reconcile()
+            except Exception as e:
+                logger.error("{} reconcile failed: {}", service.name, e)
+
+
+def request_trades(body):
+    entries = [[symbol] for symbol in body.get("symbols", [])]
+    # A trade without its own side falls back to the top level side.
+    for trade in body.get("trades", []):
+        side = trade.get("side")
+        entries.append([trade.get("symbol", "")] if side is None else [trade.get("symbol", ""), side])
+    return collect_trades(entries, default_side=body.get("side"))
+
+
+def create_app(services):
+    app = Flask(__name__)
+
+    def service_for(body):
+        broker = body.get("broker")
+        if broker is None and len(services) == 1:
+            broker = next(iter(services))
+        if broker not in services:
+            return None, (jsonify(error=f"Unknown broker '{broker}', expected one of {sorted(services)}"), 400)
+        return services[broker], None
+
+    @app.get("/health")
+    def health():
+        return jsonify(status="ok", brokers={name: len(service.account_ids) for name, service in services.items()})
+
+    @app.post("/orders")
+    def orders():
+        body = request.get_json(silent=True) or {}
+        service, error = service_for(body)
+        if error:
+            return error
+        try:
+            trades = request_trades(body)
+            quantity = int(body.get("quantity", 1))
+            limit = body.get("limit")
+            if limit is not None and limit != "auto":
+                limit = float(limit)
+            results = service.execute(trades, quantity, limit)
+        except (TypeError, ValueError) as e:
+            return jsonify(error=str(e)), 400
+
+        failed = any(result.failed() for result in results)
+        return jsonify(broker=service.name, results=[result.as_dict() for result in results]), 502 if failed else 200
+
+    @app.post("/refresh")
+    def refresh():
+        body = request.get_json(silent=True) or {}
+        service, error = service_for(body)
+        if error:
+            return error
+        service.refresh()
+        return jsonify(broker=service.name, accounts=len(service.account_ids))
+
+    @app.get("/latency")
+    def latency():
+        return jsonify(TRACER.summary())
+
+    return app
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Run a local order service that keeps broker state warm")
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument(
+        '--broker',
+        action='append',
+        choices=BROKERS,
+        help='Broker to serve, may be repeated (default: every broker with credentials)',
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=1,
+        help='Maximum number of Tradier orders submitted in parallel',
+    )
+    parser.add_argument(
+        '--refresh-interval',
+        type=float,
+        default=DEFAULT_REFRESH_INTERVAL,
+        help='Seconds between background position reloads',
+    )
+    parser.add_argument(
+        '--reconcile-interval',
+        type=float,
+        default=DEFAULT_RECONCILE_INTERVAL,
+        help='Seconds between polls for order status changes (Schwab)',
+    )
+    parser.add_argument(
+        '--stream-quotes',
+        action='store_true',
+        help='Price Tradier limit orders from a live quote stream instead of polling',
+    )
+    # --no-risk-check and the risk thresholds
+    add_risk_arguments(parser)
+
+    parser.add_argument('-v', '--verbose', action='count', default=0, help='-v logs every broker call, -vv also the payloads')
+    args = parser.parse_args()
+    tracing.configure(args.verbose)
+
+    brokers = brokers_from_env(selected_brokers(parser, args.broker, os.getenv), os.getenv, args.concurrency)
+    if args.stream_quotes and 'tradier' in brokers:
+        brokers['tradier'].stream_quotes()
+    services = {name: BrokerService(broker, risk_limits(args)) for name, broker in brokers.items()}
+
+    stopped = threading.Event()
+    refresher = threading.Thread(target=refresh_loop, args=(services, args.refresh_interval, stopped), daemon=True)
+    refresher.start()
+    reconciler = threading.Thread(target=reconcile_loop, args=(services, args.reconcile_interval, stopped), daemon=True)
+    reconciler.start()
+
+    app = create_app(services)
+    # threaded so a slow order for one broker does not block the other.
+    app.run(host=args.host, port=args.port, threaded=True)
+    stopped.set()
+
+
+if __name__ == "__main__":
+    main()
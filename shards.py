@@ -0,0 +1,125 @@
+from batch import build_plan
+from brokers import credentials_from_env, make_broker
+from collections import namedtuple
+from multiprocessing import get_context
+from orders import priced_plan
+from tracing import logger
+import tracing
+
+
+# Run one broker login per worker process. Every credential set in the
+# environment (see brokers.credentials_from_env) is a shard with its own
+# process, HTTP session and rate limiter, so throughput grows with the number
+# of logins instead of being capped by one token's budget.
+#
+# Each shard scans the accounts its login can see and sends the account ids
+# back. An account visible to more than one login of the same broker is given
+# to exactly one of them, whichever has the fewest accounts so far, so nothing
+# is traded twice. Shards then plan, price and place their own accounts'
+# orders and send back their OrderResults for one merged report.
+#
+# Workers are spawned rather than forked so the parent's threads and open
+# sessions never leak into them, and so it runs the same way on Windows.
+
+
+Shard = namedtuple('Shard', ['name', 'broker', 'credentials'])
+
+
+def shards_from_env(names, getenv):
+    shards = []
+    for broker in names:
+        for index, credentials in enumerate(credentials_from_env(broker, getenv)):
+            name = broker if index == 0 else f"{broker}#{index + 1}"
+            shards.append(Shard(name, broker, credentials))
+    return shards
+
+
+def run_shard(shard, conn, trades, quantity, limit, concurrency, risk, verbosity):
+    # Log sinks are per process.
+    tracing.configure(verbosity)
+    try:
+        broker = make_broker(shard.broker, shard.credentials, concurrency)
+        account_ids, progress = broker.snapshot()
+        conn.send(("accounts", list(account_ids)))
+        assigned = conn.recv()
+        plan = build_plan(assigned, trades, progress)
+        plan, prices = priced_plan(plan, trades, quantity, limit, broker.quotes, risk)
+        conn.send(("results", broker.place_plan(plan, quantity, prices)))
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+# claims maps shard name -> (broker, account ids it can see). Returns shard
+# name -> account ids it should trade, each account in exactly one shard.
+def assign_accounts(claims):
+    # Dicts as ordered sets, so moving an account is O(1).
+    assigned = {name: {} for name in claims}
+    owner = {}
+    for name, (broker, account_ids) in claims.items():
+        for account_id in account_ids:
+            key = (broker, account_id)
+            current = owner.get(key)
+            if current is None:
+                owner[key] = name
+                assigned[name][account_id] = None
+            elif len(assigned[name]) < len(assigned[current]) - 1:
+                del assigned[current][account_id]
+                assigned[name][account_id] = None
+                owner[key] = name
+    return {name: list(accounts) for name, accounts in assigned.items()}
+
+
+# Run the trades on every shard at once. Returns shard name -> OrderResults;
+# a shard that failed is reported and returns no results, without stopping
+# the others.
+def run_shards(shards, trades, quantity, limit=None, concurrency=1, risk=None, verbosity=0):
+    context = get_context("spawn")
+    workers = {}
+    for shard in shards:
+        parent, child = context.Pipe()
+        process = context.Process(
+            target=run_shard,
+            args=(shard, child, trades, quantity, limit, concurrency, risk, verbosity),
+            name=f"shard-{shard.name}",
+        )
+        process.start()
+        child.close()
+        workers[shard.name] = (shard, parent, process)
+
+    claims = {}
+    results = {}
+    for name, (shard, conn, process) in workers.items():
+        kind, payload = receive(conn)
+        if kind == "accounts":
+            claims[name] = (shard.broker, payload)
+        else:
+            logger.error("Shard {} failed: {}", name, payload)
+            results[name] = []
+
+    for name, account_ids in assign_accounts(claims).items():
+        logger.info("Shard {}: {}/{} accounts", name, len(account_ids), len(claims[name][1]))
+        workers[name][1].send(account_ids)
+
+    for name in claims:
+        shard, conn, process = workers[name]
+        kind, payload = receive(conn)
+        if kind == "results":
+            results[name] = payload
+        else:
+            logger.error("Shard {} failed: {}", name, payload)
+            results[name] = []
+
+    for shard, conn, process in workers.values():
+        conn.close()
+        process.join()
+    return {shard.name: results[shard.name] for shard in shards}
+
+
+# A worker that died without a word is an error too.
+def receive(conn):
+    try:
+        return conn.recv()
+    except EOFError:
+        return ("error", "worker exited")
@@ -0,0 +1,101 @@
+from batch import add_batch_arguments, add_risk_arguments, add_trace_arguments, announce_trades, build_plan, parse_trades, report_orders
+from brokers import BROKERS, brokers_from_env, selected_brokers
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from orders import priced_plan
+from risk import risk_limits
+from shards import run_shards, shards_from_env
+from tracing import logger
+import argparse
+import os
+import time
+import tracing
+
+
+# Snapshot, plan, risk check and execute the trades against one broker. Limit
+# prices and the risk check use that broker's own quotes.
+def run_broker(broker, trades, quantity, limit=None, risk=None):
+    account_ids, progress = broker.snapshot()
+    plan = build_plan(account_ids, trades, progress)
+    plan, prices = priced_plan(plan, trades, quantity, limit, broker.quotes, risk)
+    return broker.place_plan(plan, quantity, prices)
+
+
+# Run the same trades against every broker at once. Each broker keeps its own
+# stop-on-first-failure behaviour; a broker that raises is logged and returns
+# no results, without stopping the other or the merged report.
+def run_brokers(brokers, trades, quantity, limit=None, risk=None):
+    with ThreadPoolExecutor(max_workers=max(1, len(brokers))) as pool:
+        futures = {name: pool.submit(run_broker, broker, trades, quantity, limit, risk) for name, broker in brokers.items()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error("{} failed: {}: {}", name, type(e).__name__, e)
+                results[name] = []
+        return results
+
+
+def main():
+    # Create the parser object
+    parser = argparse.ArgumentParser(description="Buy or sell stocks across Schwab and Tradier accounts")
+
+    # --buy/--sell, the symbols and the --file batch input
+    add_batch_arguments(parser)
+
+    parser.add_argument(
+        '--broker',
+        action='append',
+        choices=BROKERS,
+        help='Broker to trade through, may be repeated (default: every broker with credentials)',
+    )
+
+    parser.add_argument(
+        '--quantity',
+        type=int,
+        default=1,
+        help='Stock quantity',
+    )
+
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=1,
+        help='Maximum number of Tradier orders submitted in parallel',
+    )
+
+    # --no-risk-check and the risk thresholds
+    add_risk_arguments(parser)
+
+    # -v, --trace and --trace-format
+    add_trace_arguments(parser)
+
+    # Parse the arguments
+    args = parser.parse_args()
+    trades = parse_trades(parser, args)
+    tracing.start(args)
+
+    load_dotenv()
+    announce_trades(trades)
+
+    # With more than one login for a broker, each login runs in its own
+    # process; otherwise the brokers run on threads in this one.
+    names = selected_brokers(parser, args.broker, os.getenv)
+    shards = shards_from_env(names, os.getenv)
+    start = time.perf_counter()
+    if len(shards) > len(names):
+        print(f"Running {len(shards)} shards in separate processes")
+        results = run_shards(shards, trades, args.quantity, args.limit, args.concurrency, risk_limits(args), args.verbose)
+    else:
+        brokers = brokers_from_env(names, os.getenv, args.concurrency)
+        results = run_brokers(brokers, trades, args.quantity, args.limit, risk_limits(args))
+    elapsed = time.perf_counter() - start
+
+    print("All brokers:")
+    report_orders([result for name in results for result in results[name]], elapsed)
+    tracing.finish(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import json
+import random
+import threading
+import time
+
+import requests
+
+from tracing import logger
+
+
+# Streaming market data. QuoteStream holds one push connection to Tradier's
+# HTTP streaming API and keeps a live in-memory last/bid/ask table for the
+# subscribed symbols, so buying_limit/selling_limit can price an order from
+# memory instead of polling /v1/markets/quotes.
+#
+#   POST /v1/markets/events/session           -> {"stream": {"url": ..., "sessionid": ...}}
+#   POST <url>?symbols=...&sessionid=...      -> newline delimited JSON events
+#
+# StandInServer speaks the same two endpoints locally for testing.
+
+
+SESSION_PATH = "/v1/markets/events/session"
+EVENT_FILTER = "quote,trade"
+RECONNECT_DELAY = 1.0
+# Quotes older than this (seconds) are not served; callers fall back to REST.
+MAX_QUOTE_AGE = 10.0
+MAX_RECONNECT_DELAY = 30.0
+
+
+class QuoteStream():
+    # api_url is where the streaming session is created (tradier.API_URL, or a
+    # StandInServer's url).
+    def __init__(self, token, symbols=(), api_url="https://api.tradier.com"):
+        self.token = token
+        self.api_url = api_url
+        self.symbols = set(symbols)
+        # symbol -> {"last", "bid", "ask", "volume", "updated"}
+        self.table = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.connected = threading.Event()
+        # Set when the connection is closed on purpose to pick up new symbols.
+        self.resubscribing = threading.Event()
+        # time.time() the current connection started streaming.
+        self.connected_at = None
+        self.response = None
+        self.thread = None
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {token}',
+            'Accept': 'application/json',
+        })
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.disconnect()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    # Add symbols to the stream. Tradier fixes the symbol list per connection,
+    # so the stream reconnects with the new list.
+    def subscribe(self, symbols):
+        with self.lock:
+            new = set(symbols) - self.symbols
+            if not new:
+                return
+            self.symbols |= new
+        self.resubscribing.set()
+        self.disconnect()
+
+    def disconnect(self):
+        response = self.response
+        if response is not None:
+            response.close()
+
+    def get(self, symbol):
+        with self.lock:
+            quote = self.table.get(symbol)
+            return None if quote is None else dict(quote)
+
+    # Same shape as tradier.share_quotes, for symbols with a quote younger than
+    # max_age seconds that arrived over the current connection. A dropped or
+    # failing stream serves nothing rather than its last prices.
+    def quotes(self, symbols, max_age=MAX_QUOTE_AGE):
+        now = time.time()
+        with self.lock:
+            connected_at = self.connected_at
+            if not self.connected.is_set() or connected_at is None:
+                return {}
+            fresh = {}
+            for symbol in symbols:
+                quote = self.table.get(symbol)
+                if quote is not None and quote["updated"] >= connected_at and now - quote["updated"] <= max_age:
+                    fresh[symbol] = dict(quote)
+            return fresh
+
+    def run(self):
+        delay = RECONNECT_DELAY
+        while not self.stopped.is_set():
+            with self.lock:
+                symbols = sorted(self.symbols)
+            if not symbols:
+                # subscribe() sets this, so the first symbols connect straight away.
+                self.resubscribing.wait(RECONNECT_DELAY)
+                continue
+            self.resubscribing.clear()
+            try:
+                self.consume(symbols)
+                delay = RECONNECT_DELAY
+            except Exception as e:
+                # Closing the response from another thread surfaces as an
+                # arbitrary error inside the read, so check why it ended first.
+                if self.stopped.is_set():
+                    return
+                if self.resubscribing.is_set():
+                    continue
+                logger.warning("Quote stream dropped: {}, reconnecting in {:.1f}s", e, delay)
+                self.stopped.wait(delay)
+                delay = min(MAX_RECONNECT_DELAY, delay * 2)
+            finally:
+                self.connected.clear()
+
+    def consume(self, symbols):
+        created = self.session.post(f"{self.api_url}{SESSION_PATH}", timeout=10)
+        created.raise_for_status()
+        stream = created.json()["stream"]
+
+        self.response = self.session.post(
+            stream["url"],
+            params={
+                "symbols": ",".join(symbols),
+                "sessionid": stream["sessionid"],
+                "filter": EVENT_FILTER,
+                "linebreak": "true",
+            },
+            stream=True,
+            timeout=(10, None),
+        )
+        try:
+            # subscribe() or stop() may have run while the session was being
+            # created, when there was no response yet for them to close.
+            if self.resubscribing.is_set() or self.stopped.is_set():
+                return
+            self.response.raise_for_status()
+            with self.lock:
+                self.connected_at = time.time()
+            self.connected.set()
+            for line in self.response.iter_lines(chunk_size=None):
+                if line:
+                    self.apply(json.loads(line))
+        finally:
+            self.response.close()
+            self.response = None
+
+    def apply(self, event):
+        symbol = event.get("symbol")
+        kind = event.get("type")
+        if symbol is None or kind not in ("quote", "trade"):
+            return
+        now = time.time()
+        with self.lock:
+            quote = self.table.setdefault(symbol, {"last": None, "bid": None, "ask": None, "volume": None, "updated": now})
+            if kind == "quote":
+                quote["bid"] = _number(event.get("bid"))
+                quote["ask"] = _number(event.get("ask"))
+            else:
+                quote["last"] = _number(event.get("last", event.get("price")))
+                quote["volume"] = _number(event.get("cvol"))
+            quote["updated"] = now
+
+
+def _number(value):
+    return None if value is None else float(value)
+
+
+# Local stand-in for Tradier's streaming endpoints. Streams a random walk of
+# quote and trade events for whatever symbols are requested, every `interval`
+# seconds.
+class StandInServer():
+    def __init__(self, host="127.0.0.1", port=0, interval=0.05, start_price=1.0):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                path = urlparse(self.path)
+                if path.path == SESSION_PATH:
+                    body = json.dumps({"stream": {"url": f"{server.url}/v1/markets/events", "sessionid": "stand-in"}}).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                symbols = parse_qs(path.query).get("symbols", [""])[0].split(",")
+                # Chunked like the real stream, so clients see each event as it is sent.
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                try:
+                    server.stream(self.wfile, [symbol for symbol in symbols if symbol])
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self.interval = interval
+        self.start_price = start_price
+        self.stopped = threading.Event()
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self.thread = None
+
+    def stream(self, wfile, symbols):
+        prices = {symbol: self.start_price for symbol in symbols}
+        volume = 0
+        while not self.stopped.is_set():
+            for symbol in symbols:
+                price = max(0.01, prices[symbol] * (1 + random.uniform(-0.01, 0.01)))
+                prices[symbol] = price
+                volume += 100
+                events = [
+                    {"type": "quote", "symbol": symbol, "bid": round(price * 0.995, 4), "ask": round(price * 1.005, 4)},
+                    {"type": "trade", "symbol": symbol, "price": f"{price:.4f}", "last": f"{price:.4f}", "cvol": str(volume)},
+                ]
+                chunk = b"".join(json.dumps(event).encode() + b"\n" for event in events)
+                wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            wfile.flush()
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# Watch a few symbols stream in from the stand-in server (or Tradier with --live).
+def main():
+    parser = argparse.ArgumentParser(description="Stream live quotes into memory")
+    parser.add_argument('symbols', nargs='+', help='Symbols to stream')
+    parser.add_argument('--seconds', type=float, default=3, help='How long to watch')
+    parser.add_argument('--live', action='store_true', help='Stream from Tradier instead of the stand-in')
+    args = parser.parse_args()
+
+    if args.live:
+        from dotenv import load_dotenv
+        import os
+        load_dotenv()
+        stand_in = None
+        stream = QuoteStream(os.getenv('TRADIER_ACCESS_TOKEN'), args.symbols)
+    else:
+        stand_in = StandInServer().start()
+        stream = QuoteStream("stand-in", args.symbols, api_url=stand_in.url)
+
+    stream.start()
+    deadline = time.time() + args.seconds
+    while time.time() < deadline:
+        time.sleep(1)
+        print(stream.quotes(args.symbols))
+    stream.stop()
+    if stand_in is not None:
+        stand_in.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import base64
+import json
+import threading
+import time
+
+import requests
+from loguru import logger
+
+from atomic import atomic_write_json
+
+
+TOKEN_URL = "https://api.schwabapi.com/v1/oauth/token"
+DEFAULT_TOKEN_PATH = "./schwab_tokens.json"
+
+# Schwab access tokens last 30 minutes and refresh tokens 7 days. Refresh the
+# access token this many seconds before it expires so callers never see a 401.
+REFRESH_MARGIN = 120
+REFRESH_TOKEN_LIFETIME = 7 * 24 * 60 * 60
+
+
+def basic_auth_headers(app_key, app_secret):
+    credentials = f"{app_key}:{app_secret}"
+    base64_credentials = base64.b64encode(credentials.encode("utf-8")).decode(
+        "utf-8"
+    )
+    return {
+        "Authorization": f"Basic {base64_credentials}",
+        "Content-Type": "application/x-www-form-urlencoded",
+    }
+
+
+# Persists Schwab OAuth tokens to disk and keeps the access token fresh.
+#
+# Tokens are written atomically (temp file + rename, owner read/write only) with
+# absolute expiry timestamps, so a later run can pick them up and skip the
+# browser based authorization code exchange entirely. start() launches a daemon
+# thread that refreshes the access token shortly before it expires, and
+# session() returns a requests.Session whose Authorization header tracks it.
+class TokenStore():
+    def __init__(self, app_key, app_secret, path=DEFAULT_TOKEN_PATH):
+        self.app_key = app_key
+        self.app_secret = app_secret
+        self.path = path
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.sessions = []
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.tokens = json.load(f)
+        except FileNotFoundError:
+            self.tokens = {}
+        except json.JSONDecodeError:
+            logger.warning("Ignoring unreadable token file {}", self.path)
+            self.tokens = {}
+
+    def save(self):
+        atomic_write_json(self.path, self.tokens, mode=0o600)
+
+    # Store a token response from the authorization code or refresh grant.
+    def update(self, token_response, now=None):
+        now = time.time() if now is None else now
+        if "access_token" not in token_response:
+            raise ValueError(f"Token response has no access token: {token_response}")
+        with self.lock:
+            tokens = dict(self.tokens)
+            tokens.update(token_response)
+            tokens["access_expires_at"] = now + int(token_response.get("expires_in", 1800))
+            # The refresh grant returns the same refresh token, only a new one
+            # from the authorization code grant restarts its 7 day lifetime.
+            if token_response.get("refresh_token") != self.tokens.get("refresh_token"):
+                tokens["refresh_expires_at"] = now + REFRESH_TOKEN_LIFETIME
+            self.tokens = tokens
+            self.save()
+            for session in self.sessions:
+                session.headers["Authorization"] = f"Bearer {tokens['access_token']}"
+
+    def access_token(self):
+        with self.lock:
+            return self.tokens.get("access_token")
+
+    def access_valid(self, margin=0):
+        with self.lock:
+            return time.time() + margin < self.tokens.get("access_expires_at", 0)
+
+    def refresh_valid(self):
+        with self.lock:
+            return "refresh_token" in self.tokens and time.time() < self.tokens.get("refresh_expires_at", 0)
+
+    def refresh(self):
+        with self.lock:
+            refresh_token = self.tokens["refresh_token"]
+        response = requests.post(
+            url=TOKEN_URL,
+            headers=basic_auth_headers(self.app_key, self.app_secret),
+            data={
+                "grant_type": "refresh_token",
+                "refresh_token": refresh_token,
+            },
+            timeout=10,
+        )
+        response.raise_for_status()
+        self.update(response.json())
+        logger.info("Refreshed Schwab access token")
+
+    # Refresh now if the stored access token is missing or about to expire.
+    # Returns False when the refresh token is gone too and a new login is needed.
+    def ensure_fresh(self):
+        if self.access_valid(margin=REFRESH_MARGIN):
+            return True
+        if not self.refresh_valid():
+            return False
+        self.refresh()
+        return True
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.refresh_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def refresh_loop(self):
+        while not self.stopped.is_set():
+            with self.lock:
+                expires_at = self.tokens.get("access_expires_at", 0)
+            delay = max(0, expires_at - REFRESH_MARGIN - time.time())
+            if self.stopped.wait(delay):
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("Token refresh failed: {}", e)
+                # Back off rather than spin if the API is down.
+                if self.stopped.wait(30):
+                    return
+
+    # A pooled session authorised with the current access token, kept up to
+    # date by every refresh.
+    def session(self):
+        session = requests.Session()
+        session.headers["Accept"] = "application/json"
+        with self.lock:
+            session.headers["Authorization"] = f"Bearer {self.tokens.get('access_token')}"
+            self.sessions.append(session)
+        return session
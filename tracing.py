@@ -0,0 +1,230 @@
+from contextlib import contextmanager
+import bisect
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+
+# Timing spans around every broker call. Each span carries the endpoint (with
+# account ids collapsed so calls group), the account, status, response bytes
+# and duration. Spans always feed per endpoint histograms; the individual spans
+# are only kept when a trace file was asked for, and are written as JSON lines
+# or in Chrome's trace event format (load it in chrome://tracing or Perfetto).
+#
+# tracing.logger stands in for loguru's logger but only imports loguru on first
+# use, so the CLIs' --help and argument errors don't pay for it.
+#
+# Verbosity picks the loguru level on stderr:
+#   0  INFO   order summaries, warnings
+#   1  DEBUG  one line per broker call
+#   2  TRACE  full request and response payloads
+
+
+VERBOSITY_LEVELS = ("INFO", "DEBUG", "TRACE")
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open ended.
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+ACCOUNT_PATH = re.compile(r"(/accounts/)([^/?]+)")
+
+
+class _LazyLogger():
+    def __getattr__(self, name):
+        from loguru import logger
+        return getattr(logger, name)
+
+
+logger = _LazyLogger()
+
+
+class Span():
+    __slots__ = ("name", "endpoint", "account", "status", "bytes", "start", "duration", "thread")
+
+    def __init__(self, name, endpoint, account=None):
+        self.name = name
+        self.endpoint = endpoint
+        self.account = account
+        self.status = None
+        self.bytes = None
+        self.start = time.perf_counter()
+        self.duration = None
+        self.thread = threading.get_ident()
+
+    # Status and body size of a requests.Response.
+    def response(self, response):
+        self.status = response.status_code
+        self.bytes = len(response.content)
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "endpoint": self.endpoint,
+            "account": self.account,
+            "status": self.status,
+            "bytes": self.bytes,
+            "start": self.start,
+            "duration": self.duration,
+            "thread": self.thread,
+        }
+
+
+class Histogram():
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.bytes = 0
+
+    def add(self, span):
+        ms = span.duration * 1000
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        if span.status is not None and span.status >= 300:
+            self.errors += 1
+        self.bytes += span.bytes or 0
+
+    # Upper bound of the bucket holding the given percentile.
+    def percentile(self, percent):
+        rank = percent / 100 * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS + (None,), self.counts):
+            seen += count
+            if count and seen >= rank:
+                return self.max if bound is None else min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max,
+            "buckets_ms": {str(bound): count for bound, count in zip(BUCKETS_MS + ("inf",), self.counts) if count},
+        }
+
+
+class Tracer():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.accounts = {}
+        # None unless spans are being kept for export.
+        self.spans = None
+        self.origin = time.perf_counter()
+
+    def keep_spans(self):
+        with self.lock:
+            if self.spans is None:
+                self.spans = []
+
+    @contextmanager
+    def span(self, name, endpoint, account=None):
+        span = Span(name, endpoint, account)
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - span.start
+            self.finish(span)
+
+    def finish(self, span):
+        with self.lock:
+            key = f"{span.name} {span.endpoint}"
+            self.histograms.setdefault(key, Histogram()).add(span)
+            if span.account is not None:
+                self.accounts.setdefault(f"{span.name} {span.account}", Histogram()).add(span)
+            if self.spans is not None:
+                self.spans.append(span)
+        # Formatted by loguru only when DEBUG is enabled.
+        logger.debug(
+            "{} {} account={} status={} bytes={} {:.1f}ms",
+            span.name, span.endpoint, span.account, span.status, span.bytes, span.duration * 1000,
+        )
+
+    # Histogram summaries by endpoint and by account.
+    def summary(self):
+        with self.lock:
+            return {
+                "endpoints": {key: histogram.summary() for key, histogram in self.histograms.items()},
+                "accounts": {key: histogram.summary() for key, histogram in self.accounts.items()},
+            }
+
+    def write_jsonl(self, path):
+        with self.lock:
+            spans = list(self.spans or [])
+        with open(path, "w") as f:
+            for span in spans:
+                record = span.as_dict()
+                record["start"] -= self.origin
+                f.write(json.dumps(record) + "\n")
+
+    def write_chrome(self, path):
+        with self.lock:
+            spans = list(self.spans or [])
+        events = []
+        for span in spans:
+            events.append({
+                "name": span.endpoint,
+                "cat": span.name,
+                "ph": "X",
+                "ts": (span.start - self.origin) * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": os.getpid(),
+                "tid": span.thread,
+                "args": {"account": span.account, "status": span.status, "bytes": span.bytes},
+            })
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+TRACER = Tracer()
+
+
+# Collapse the account id in a path so calls group by endpoint.
+def endpoint_of(method, path):
+    path = ACCOUNT_PATH.sub(r"\1{id}", path)
+    return f"{method} {path}"
+
+
+def account_of(path):
+    match = ACCOUNT_PATH.search(path)
+    return None if match is None else match.group(2)
+
+
+def configure(verbosity=0):
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level=VERBOSITY_LEVELS[min(verbosity, len(VERBOSITY_LEVELS) - 1)])
+
+
+# Set up logging and span collection from batch.add_trace_arguments' arguments.
+def start(args):
+    configure(args.verbose)
+    if args.trace is not None:
+        TRACER.keep_spans()
+
+
+# Write the trace file, and the latency histograms when asked for either.
+def finish(args):
+    if args.trace is not None:
+        if args.trace_format == "chrome":
+            TRACER.write_chrome(args.trace)
+        else:
+            TRACER.write_jsonl(args.trace)
+        logger.info("Wrote broker call trace to {}", args.trace)
+    if args.trace is not None or args.verbose:
+        for endpoint, summary in sorted(TRACER.summary()["endpoints"].items()):
+            logger.info(
+                "{}: {} calls, {} errors, p50={:.0f}ms p99={:.0f}ms max={:.0f}ms",
+                endpoint, summary['count'], summary['errors'], summary['p50_ms'], summary['p99_ms'], summary['max_ms'],
+            )
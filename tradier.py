@@ -1,8 +1,38 @@
+from collections import namedtuple
+from batch import (
+    OrderResult,
+    PlannedOrder,
+    add_batch_arguments,
+    add_fill_arguments,
+    add_history_arguments,
+    add_journal_arguments,
+    add_quote_cache_arguments,
+    add_replay_arguments,
+    add_risk_arguments,
+    add_trace_arguments,
+    announce_trades,
+    build_plan,
+    parse_trades,
+    report_orders,
+)
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from journal import journaled_plan, open_journal
+from orders import buying_limit, priced_plan, selling_limit, tradier_order
+from payloads import response_json, tradier_holdings
+from positions import PositionIndex
+from quote_cache import QuoteCache
+from ratelimit import ACCOUNT, MARKET, RATE_LIMIT_RETRIES, TRADING, tradier_limiter
+from risk import risk_limits
+from tracing import TRACER, account_of, endpoint_of, logger
+import tracing
+import datetime
 import json
 import os
-import requests
+from types import MappingProxyType
 import argparse
+import threading
+import time
 
 
 # If data is a list, return that list.
@@ -16,184 +46,460 @@ def validate_list(data):
         raise ValueError("Expected a dictionary or list of dictionaries.")
 
 
-BUY_LIMIT_MULTIPLIER = 1.1
-SELL_LIMIT_MULTIPLIER = 0.9
-
-def buying_limit(current_val):
-    limit = current_val * BUY_LIMIT_MULTIPLIER
-    limit = round(limit, 2)
-    return limit
-
-def selling_limit(current_val):
-    limit = current_val * SELL_LIMIT_MULTIPLIER
-    limit = round(limit, 2)
-    return limit
+API_URL = "https://api.tradier.com"
+
+# Connect and read timeouts (seconds) applied to every call unless overridden.
+DEFAULT_TIMEOUT = (3.05, 10)
+# Keep-alive connections held open per host. get_client grows the pool to the
+# requested --concurrency so parallel order submission never has to open a
+# fresh TLS connection.
+DEFAULT_POOL_SIZE = 16
+DEFAULT_RETRIES = 3
+# Reads are safe to issue in parallel, so positions and quotes are fetched
+# concurrently regardless of the --concurrency cap used for order submission.
+DEFAULT_FETCH_CONCURRENCY = 8
+DEFAULT_BACKOFF = 0.5
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# Only GET is safe to repeat after a 5xx; a POST that failed server side may
+# still have created the order. A 429 was rejected outright so any method may retry.
+IDEMPOTENT_METHODS = ("GET",)
+
+
+class TradierClient():
+    def __init__(
+        self,
+        token,
+        base_url=API_URL,
+        timeout=DEFAULT_TIMEOUT,
+        pool_size=DEFAULT_POOL_SIZE,
+        retries=DEFAULT_RETRIES,
+        backoff=DEFAULT_BACKOFF,
+        limiter=None,
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # Optional ratelimit.RateLimiter shared by every call made with this token.
+        self.limiter = limiter
+
+        # requests is most of this module's import time, so --help skips it.
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        # Headers, including the Authorization Bearer Token and Accept header
+        self.session.headers.update({
+            'Authorization': f'Bearer {token}',
+            'Accept': 'application/json',
+        })
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    # idempotent overrides the method based default, e.g. for read only POSTs.
+    def request(self, method, path, timeout=None, idempotent=None, **kwargs):
+        url = f"{self.base_url}{path}"
+        timeout = timeout or self.timeout
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        endpoint_class = endpoint_class_for(method, path)
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                self.limiter.acquire(endpoint_class)
+            with TRACER.span("tradier", endpoint_of(method, path), account_of(path)) as span:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+                span.response(response)
+            if self.limiter is not None:
+                self.limiter.observe(endpoint_class, response)
+            if not self.should_retry(idempotent, response, attempt):
+                return response
+            attempt += 1
+            if response.status_code == 429 and self.limiter is not None:
+                # The limiter has paused this endpoint class until the window
+                # resets, the next acquire() waits for it.
+                logger.warning("{} {} rate limited, waiting for the limiter", method, path)
+                continue
+            delay = self.retry_delay(response, attempt - 1)
+            logger.warning("{} {} status={}, retrying in {:.2f}s", method, path, response.status_code, delay)
+            time.sleep(delay)
+
+    def should_retry(self, idempotent, response, attempt):
+        if response.status_code not in RETRY_STATUS:
+            return False
+        if response.status_code == 429:
+            return attempt < max(self.retries, RATE_LIMIT_RETRIES)
+        return attempt < self.retries and idempotent
+
+    def retry_delay(self, response, attempt):
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+# Which Tradier rate limit group a call counts against.
+def endpoint_class_for(method, path):
+    if path.startswith("/v1/markets"):
+        return MARKET
+    if method == "POST" and path.endswith("/orders"):
+        return TRADING
+    return ACCOUNT
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Return the shared client for a token, creating it on first use so every call
+# made with the same token reuses one connection pool. concurrency sizes the
+# pool when the client is created, so pass it on the first call.
+def get_client(token, concurrency=1):
+    with _clients_lock:
+        client = _clients.get(token)
+        if client is None:
+            client = TradierClient(token, pool_size=max(DEFAULT_POOL_SIZE, concurrency), limiter=tradier_limiter())
+            _clients[token] = client
+        return client
 
 
 def handle_account(account_id, token):
-    balance_url = f"https://api.tradier.com/v1/accounts/{account_id}/balances"
-    # Headers, including the Authorization Bearer Token and Accept header
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Accept': 'application/json'
-    }
-
-    # Make the GET request
-    response = requests.get(balance_url, headers=headers)
+    response = get_client(token).get(f"/v1/accounts/{account_id}/balances")
     data = response.json()
-    print(f"account={account_id}", data)
-
-
-def place_order(account_id, token, symbol, side, quantity):
-    orders_url = f"https://api.tradier.com/v1/accounts/{account_id}/orders"
-    # Headers, including the Authorization Bearer Token and Accept header
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Accept': 'application/json',
-    }
-    # class - The kind of order to be placed. One of: equity, option, multileg, combo.
-    # symbol - The symbol to be ordered.
-    # duration - The time for which the order will be remain in effect (Day or GTC).
-    # side - The side of the order (buy or sell).
-    # quantity - The number of shares to be ordered, in whole numbers.
-    # type - The type of order to be placed (market, limit, etc.)
-    ##
-    # POST /v1/accounts/12345678/orders HTTP/1.1
-    # Host: api.tradier.com
-    # Accept: \*/\*
-    # class=equity&symbol=AAPL&duration=day&side=buy&quantity=100&type=market
-    params = {
-        "class": "equity",
-        "symbol": symbol,
-        "duration": "day",
-        "side": side,
-        "quantity": quantity,
-        "type": "market",
-    }
-    print(account_id, params)
-    # Make the GET request
-    response = requests.post(orders_url, headers=headers, params=params)
-    print(response.status_code)
-    print(response.text)
+    logger.info("account={} {}", account_id, data)
+
+
+# Market order when price is None, otherwise a limit order at that price.
+# See orders.TradierOrderTemplate for the fields sent.
+##
+# POST /v1/accounts/12345678/orders HTTP/1.1
+# Host: api.tradier.com
+# Accept: \*/\*
+# class=equity&symbol=AAPL&duration=day&side=buy&quantity=100&type=market
+def place_order(account_id, token, symbol, side, quantity, price=None):
+    payload = tradier_order(symbol, side, quantity, price)
+    logger.debug("account={} order {}", account_id, payload)
+    response = get_client(token).post(
+        f"/v1/accounts/{account_id}/orders",
+        data=payload.body,
+        headers={'Content-Type': payload.content_type},
+    )
+    logger.trace("account={} status={} {}", account_id, response.status_code, response.text)
     return response
 
 
-def share_value(token, symbol):
-    # API allows comma separated symbols, can consider supporting this later but no current support.
-    if "," in symbol:
-        print("Multi share value not supported, returning single symbol value")
+# {"order": {"id": 257459, "status": "ok"}}
+def order_id(response):
+    try:
+        return response.json()['order']['id']
+    except (ValueError, KeyError, TypeError):
+        return None
 
-    quotes_url = f"https://api.tradier.com/v1/markets/quotes"
 
-    # Headers, including the Authorization Bearer Token and Accept header
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Accept': 'application/json',
-    }
-    params = {
-        "symbols": [symbol],
-    }
+# Pass a QuoteCache (see quote_cache_for) to serve repeated lookups from memory.
+def share_value(token, symbol, cache=None):
+    # API allows comma separated symbols, use share_quotes() for more than one.
+    if "," in symbol:
+        logger.warning("Multi share value not supported, returning single symbol value")
+        symbol = symbol.split(",")[0]
+    # share_quotes keys its result by the normalised symbol.
+    symbol = symbol.strip().upper()
 
-    # Make the GET request
-    response = requests.get(quotes_url, headers=headers, params=params)
-    data = response.json()
-    quotes = data["quotes"]["quote"]
-    quotes = validate_list(quotes)
-    if len(quotes) < 0:
+    if cache is not None:
+        quotes = cache.get_many([symbol])
+    else:
+        quotes = share_quotes(token, [symbol])
+    if symbol not in quotes:
         raise Exception("No quotes found")
-    # Only returning the first quote value found.
-    quote = quotes[0]
-    value = quote["last"]
-    return value
+    return quotes[symbol]["last"]
+
+
+# Tradier documents no hard cap on symbols per request, but GET query strings
+# get truncated by proxies well before a few hundred tickers. Chunks are sent as
+# form encoded POSTs (which the quotes endpoint accepts) to stay clear of that.
+QUOTE_CHUNK_SIZE = 100
+QUOTE_FIELDS = ("last", "bid", "ask", "volume")
+
+# Fetch quotes for many symbols, chunked and issued concurrently.
+# Returns symbol -> {"last", "bid", "ask", "volume"}. Unknown symbols are left out.
+def share_quotes(token, symbols, chunk_size=QUOTE_CHUNK_SIZE, concurrency=DEFAULT_FETCH_CONCURRENCY):
+    unique = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols if symbol.strip()))
+    chunks = [unique[i:i + chunk_size] for i in range(0, len(unique), chunk_size)]
+    if not chunks:
+        return {}
+
+    client = get_client(token)
+
+    def fetch(chunk):
+        response = client.post(
+            "/v1/markets/quotes",
+            data={"symbols": ",".join(chunk)},
+            idempotent=True,
+        )
+        return parse_quotes(response.json())
+
+    quotes = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks)))) as pool:
+        for found in pool.map(fetch, chunks):
+            quotes.update(found)
+    return quotes
+
+
+# Buy and sell limit prices for every symbol from a single batched quote fetch.
+def watchlist_limits(token, symbols, cache=None):
+    if cache is not None:
+        quotes = cache.get_many(symbols)
+    else:
+        quotes = share_quotes(token, symbols)
+    limits = {}
+    for symbol, quote in quotes.items():
+        if quote["last"] is None:
+            continue
+        limits[symbol] = (buying_limit(quote["last"]), selling_limit(quote["last"]))
+    return limits
+
+
+def quote_cache_for(token, **kwargs):
+    return QuoteCache(lambda symbols: share_quotes(token, symbols), **kwargs)
+
+
+def parse_quotes(data):
+    quotes = {}
+    found = (data.get("quotes") or {}).get("quote")
+    if not found:
+        return quotes
+    for quote in validate_list(found):
+        quotes[quote["symbol"]] = {field: quote.get(field) for field in QUOTE_FIELDS}
+    return quotes
+
+
+# Daily OHLCV candles for history.PriceHistory.update, from start_ms's date
+# until today. Minute bars are only fetched from Schwab.
+def history_candles(token, symbol, frequency, start_ms):
+    if frequency != "daily":
+        raise ValueError(f"Tradier price history is daily only, not {frequency}")
+    start = datetime.datetime.fromtimestamp(start_ms / 1000, datetime.timezone.utc).date()
+    response = get_client(token).get(
+        "/v1/markets/history",
+        params={"symbol": symbol, "interval": "daily", "start": start.isoformat()},
+    )
+    history = response_json(response).get("history")
+    if not isinstance(history, dict) or not history.get("day"):
+        return []
+    candles = []
+    for day in validate_list(history["day"]):
+        date = datetime.datetime.strptime(day["date"], "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+        candles.append({
+            "time": int(date.timestamp() * 1000),
+            "open": day["open"],
+            "high": day["high"],
+            "low": day["low"],
+            "close": day["close"],
+            "volume": day.get("volume", 0),
+        })
+    return candles
 
 
 def account_ids(token):
     profile = user_profile(token)
-    accounts = profile['profile']['account']
+    return profile_account_ids(profile)
+
+
+def profile_account_ids(profile):
+    accounts = validate_list(profile['profile']['account'])
     account_ids = []
     for account in accounts:
         account_number = account['account_number']
-        print(account_number)
         account_ids.append(account_number)
     return account_ids
 
 
 def user_profile(token):
-    profile_url = f"https://api.tradier.com/v1/user/profile"
-    # Headers, including the Authorization Bearer Token and Accept header
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Accept': 'application/json',
-    }
-    # Make the GET request
-    response = requests.get(profile_url, headers=headers)
+    response = get_client(token).get("/v1/user/profile")
     data = response.json()
-    print(data)
+    logger.trace("profile {}", data)
     return data
 
 
 def account_symbols(account_id, token):
-    symbols = []
-    positions = account_positions(account_id, token)
-    if positions['positions'] == 'null':
-        return symbols
-    found_positions = positions['positions']['position']
-    found_positions = validate_list(found_positions)
-    for each in found_positions:
-        symbols.append(each['symbol'])
-    return symbols
+    return [holding.symbol for holding in account_holdings(account_id, token)]
+
+
+# payloads.Holding for every position held in the account, read straight from
+# the response bytes.
+def account_holdings(account_id, token):
+    response = get_client(token).get(f"/v1/accounts/{account_id}/positions")
+    logger.trace("account={} positions {}", account_id, response.content)
+    return tradier_holdings(account_id, response.content)
 
 
 def account_positions(account_id, token):
-    positions_url = f"https://api.tradier.com/v1/accounts/{account_id}/positions"
-    # Headers, including the Authorization Bearer Token and Accept header
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Accept': 'application/json',
-    }
-    # Make the GET request
-    response = requests.get(positions_url, headers=headers)
-    data = response.json()
-    print(data)
+    response = get_client(token).get(f"/v1/accounts/{account_id}/positions")
+    data = response_json(response)
+    logger.trace("account={} positions {}", account_id, data)
     return data
 
 
-class InProgress():
-    def __init__(self):
-        self.positions = {}
+OPEN_ORDER_STATUSES = ("open", "partially_filled", "pending")
 
+# Every order in the account, one request however many there are.
+def account_orders(account_id, token):
+    response = get_client(token).get(f"/v1/accounts/{account_id}/orders")
+    data = response.json()
+    orders = data.get('orders')
+    if not orders or orders == 'null':
+        return []
+    return validate_list(orders['order'])
+
+
+# (symbol, side) for every order in the account that has not finished yet.
+def account_open_orders(account_id, token):
+    open_orders = []
+    for order in account_orders(account_id, token):
+        if order['status'] in OPEN_ORDER_STATUSES and 'symbol' in order:
+            open_orders.append((order['symbol'], order['side']))
+    return open_orders
+
+
+# order id -> status of every order in the account, for fills.FillMonitor.
+def order_statuses(account_id, token):
+    return {str(order['id']): order['status'] for order in account_orders(account_id, token)}
+
+
+class InProgress(PositionIndex):
     def addSymbols(self, account_id, symbols):
-        self.positions[account_id] = symbols
+        self.add_account(account_id)
+        for symbol in symbols:
+            self.add_position(account_id, symbol)
 
     def isInProgress(self, account_id, symbol):
-        # TODO: Implement
-        accountSymbols = self.positions[account_id]
-        return symbol in accountSymbols
+        return self.holds(account_id, symbol) or self.has_open_order(account_id, symbol)
 
 
-def get_all_progress(token):
+# Point-in-time view of the profile plus every account's positions and open
+# orders. holdings maps account id -> tuple of payloads.Holding and
+# open_orders maps account id -> tuple of (symbol, side); both are read only.
+Snapshot = namedtuple('Snapshot', ['profile', 'account_ids', 'holdings', 'open_orders'])
+
+# Fetch the profile once, then all accounts' positions and open orders in one parallel wave.
+def load_snapshot(token, concurrency=DEFAULT_FETCH_CONCURRENCY):
+    profile = user_profile(token)
+    ids = tuple(profile_account_ids(profile))
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        holdings = [pool.submit(account_holdings, id, token) for id in ids]
+        open_orders = [pool.submit(account_open_orders, id, token) for id in ids]
+        holdings_by_id = {id: tuple(future.result()) for id, future in zip(ids, holdings)}
+        open_orders_by_id = {id: tuple(future.result()) for id, future in zip(ids, open_orders)}
+    return Snapshot(profile, ids, MappingProxyType(holdings_by_id), MappingProxyType(open_orders_by_id))
+
+
+def progress_from_snapshot(snapshot):
     progress = InProgress()
-    ids = account_ids(token=token)
-    for id in ids:
-        symbols = account_symbols(account_id=id, token=token)
-        progress.addSymbols(id, symbols)
+    for id in snapshot.account_ids:
+        progress.add_account(id)
+        for holding in snapshot.holdings[id]:
+            progress.add_position(id, holding.symbol, holding.quantity)
+        for symbol, side in snapshot.open_orders[id]:
+            progress.add_open_order(id, symbol, side)
     return progress
 
 
+def get_all_progress(token):
+    return progress_from_snapshot(load_snapshot(token))
+
+
+# Place every order in the plan, with up to `concurrency` orders in flight at once.
+# Keeps the serial loop's safety semantics: as soon as any order comes back with
+# status >= 300, or without a response at all, orders that have not been sent yet are
+# cancelled and reported as skipped.
+# prices maps symbol -> limit price; symbols without one get market orders.
+# With a journal.OrderJournal every submission and outcome is journaled.
+def place_plan(token, plan, quantity, concurrency=1, prices=None, journal=None):
+    import requests
+
+    prices = prices or {}
+    stop = threading.Event()
+
+    def submit(order):
+        if stop.is_set():
+            return OrderResult(order.account_id, order.symbol, order.side, skipped=True)
+        if journal is not None:
+            journal.sending(order)
+        start = time.perf_counter()
+        try:
+            resp = place_order(
+                account_id=order.account_id,
+                token=token,
+                symbol=order.symbol,
+                side=order.side,
+                quantity=quantity,
+                price=prices.get(order.symbol),
+            )
+        except requests.RequestException as e:
+            # The order may or may not have reached Tradier: no status, which
+            # the journal records as unknown, and the rest of the batch stops.
+            logger.error("account={} {} {} failed: {}", order.account_id, order.side, order.symbol, e)
+            result = OrderResult(order.account_id, order.symbol, order.side, None, time.perf_counter() - start)
+            if journal is not None:
+                journal.finished(result)
+            stop.set()
+            return result
+        latency = time.perf_counter() - start
+        result = OrderResult(order.account_id, order.symbol, order.side, resp.status_code, latency, order_id=order_id(resp))
+        if journal is not None:
+            journal.finished(result)
+        if result.failed():
+            stop.set()
+        return result
+
+    results = [None] * len(plan)
+    batch_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(submit, order): i for i, order in enumerate(plan)}
+        for future in as_completed(futures):
+            i = futures[future]
+            if future.cancelled():
+                order = plan[i]
+                results[i] = OrderResult(order.account_id, order.symbol, order.side, skipped=True)
+                continue
+            results[i] = future.result()
+            if stop.is_set():
+                for pending in futures:
+                    pending.cancel()
+    batch_time = time.perf_counter() - batch_start
+
+    # Report in plan order rather than completion order.
+    report_orders(results, batch_time)
+    return results
+
+
+def place_orders(token, account_ids, symbol, side, quantity, concurrency=1):
+    plan = [PlannedOrder(id, symbol, side) for id in account_ids]
+    return place_plan(token, plan, quantity, concurrency)
+
+
 def main():
     load_dotenv()
     token = os.getenv('TRADIER_ACCESS_TOKEN')
 
     # Create the parser object
-    parser = argparse.ArgumentParser(description="Process stock transactions: buy or sell a stock")
-
-    # Add mutually exclusive group for --buy and --sell
-    group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument('--buy', action='store_true', help='Buy a stock')
-    group.add_argument('--sell', action='store_true', help='Sell a stock')
+    parser = argparse.ArgumentParser(description="Process stock transactions: buy or sell stocks")
 
-    # Add the stock symbol argument
-    parser.add_argument('symbol', type=str, help='The stock symbol to buy or sell')
+    # --buy/--sell, the symbols and the --file batch input
+    add_batch_arguments(parser)
 
     parser.add_argument(
         '--quantity',
@@ -202,41 +508,97 @@ def main():
         help='Stock quantity',
     )
 
-    # Parse the arguments
-    args = parser.parse_args()
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=1,
+        help='Maximum number of orders submitted in parallel',
+    )
 
-    # Handle buy or sell action
-    if args.buy:
-        print(f"Buying stock: {args.symbol}")
-    elif args.sell:
-        print(f"Selling stock: {args.symbol}")
+    # --dry-run, --record and --replay
+    add_replay_arguments(parser)
 
-    progress = get_all_progress(token)
+    # --journal and --run
+    add_journal_arguments(parser)
 
-    ids = account_ids(token=token)
-    for id in ids:
-        stockInProgress = progress.isInProgress(id, args.symbol)
-        if args.buy and not stockInProgress:
-            resp = place_order(
-                account_id=id,
-                token=token,
-                symbol=args.symbol,
-                side="buy",
-                quantity=1,
-            )
-            if resp.status_code >= 300:
-                break
-        elif args.sell and stockInProgress:
-            resp = place_order(
-                account_id=id,
-                token=token,
-                symbol=args.symbol,
-                side="sell",
-                quantity=1,
-            )
-            if resp.status_code >= 300:
-                break
+    # --no-risk-check and the risk thresholds
+    add_risk_arguments(parser)
+
+    # --quote-cache and --quote-ttl
+    add_quote_cache_arguments(parser)
+
+    # --wait-fills
+    add_fill_arguments(parser)
+
+    # --history
+    add_history_arguments(parser)
+
+    # -v, --trace and --trace-format
+    add_trace_arguments(parser)
+
+    # Parse the arguments
+    args = parser.parse_args()
+    trades = parse_trades(parser, args)
+    tracing.start(args)
+    announce_trades(trades)
+    # replay pulls in requests, so like in charles.py it is only imported once
+    # the arguments are parsed.
+    from replay import install_tradier
+    install_tradier(get_client(token, args.concurrency), args)
+
+    # Account state is loaded once for the whole batch.
+    def scan():
+        snapshot = load_snapshot(token)
+        progress = progress_from_snapshot(snapshot)
+        return build_plan(snapshot.account_ids, trades, progress)
+
+    # A journaled run that was started before resumes without the scan.
+    journal = open_journal(args, "tradier", trades)
+    plan = scan() if journal is None else journaled_plan(journal, scan)
+
+    # --limit auto pads from each symbol's stored price history, filled in
+    # incrementally. numpy is only imported when the history is used.
+    multipliers = None
+    if args.history is not None and args.limit == "auto":
+        from history import PriceHistory, history_multipliers
+        fetch = lambda symbol, frequency, start: history_candles(token, symbol, frequency, start)
+        multipliers = history_multipliers(PriceHistory(args.history), trades, fetch)
+
+    # Limit prices and the pre-trade risk check share one quote fetch, served
+    # from --quote-cache when its quotes are fresh enough.
+    cache = None
+    quotes = lambda symbols: share_quotes(token, symbols)
+    if args.quote_cache is not None:
+        cache = quote_cache_for(token, ttl=args.quote_ttl, path=args.quote_cache)
+        quotes = cache.get_many
+    try:
+        plan, prices = priced_plan(plan, trades, args.quantity, args.limit, quotes, risk_limits(args), multipliers)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        if cache is not None:
+            cache.save()
+
+    results = place_plan(
+        token=token,
+        plan=plan,
+        quantity=args.quantity,
+        concurrency=args.concurrency,
+        prices=prices,
+        journal=journal,
+    )
 
+    # Dry runs have no real orders to watch.
+    if args.wait_fills is not None and not args.dry_run:
+        # asyncio is only loaded when there are fills to wait for.
+        from fills import wait_for_fills
+        wait_for_fills(
+            results,
+            lambda account_id, order_ids: order_statuses(account_id, token),
+            timeout=args.wait_fills,
+            concurrency=args.concurrency,
+        )
+    tracing.finish(args)
 
     # val = share_value(token, "AAPL")
     # print(f"APPL={val}")